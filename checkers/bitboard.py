@@ -0,0 +1,458 @@
+from collections import OrderedDict, namedtuple
+
+from checkers.constants import ROWS, COLS, BLACK, WHITE, MOVE_CACHE_SIZE
+from checkers.zobrist import PIECE_KEYS, SIDE_KEY
+
+# Only the 32 dark squares can hold a piece, so a position fits in three 32-bit masks.
+# Squares are numbered row by row, four per row: square = row * 4 + col // 2.
+SQUARES = 32
+FULL = (1 << SQUARES) - 1
+
+SQUARE_TO_ROW_COL = []
+for _row in range(ROWS):
+    for _col in range(COLS):
+        if _col % 2 == ((_row + 1) % 2):
+            SQUARE_TO_ROW_COL.append((_row, _col))
+
+
+def square(row, col):
+    """Returns the square number of the dark square at (row, col)"""
+    return row * 4 + col // 2
+
+
+# Diagonal directions. Black moves up the board (towards row 0), white moves down.
+UP_LEFT, UP_RIGHT, DOWN_LEFT, DOWN_RIGHT = range(4)
+UP = (UP_LEFT, UP_RIGHT)
+DOWN = (DOWN_LEFT, DOWN_RIGHT)
+ALL = UP + DOWN
+_OFFSETS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+
+
+def _neighbour(sq, direction):
+    row, col = SQUARE_TO_ROW_COL[sq]
+    row, col = row + _OFFSETS[direction][0], col + _OFFSETS[direction][1]
+    if 0 <= row < ROWS and 0 <= col < COLS:
+        return square(row, col)
+    return -1
+
+
+# STEP[direction][sq] is the neighbouring square, JUMP[direction][sq] is the landing square of a jump
+STEP = [[_neighbour(sq, d) for sq in range(SQUARES)] for d in range(4)]
+JUMP = [[STEP[d][STEP[d][sq]] if STEP[d][sq] != -1 else -1 for sq in range(SQUARES)] for d in range(4)]
+
+# A step changes the square number by 3, 4 or 5 depending on the row parity, a jump always by 7 or 9.
+# For every direction keep (shift, mask) pairs where mask holds the squares that step by exactly that shift,
+# so a whole set of pieces can be advanced with a couple of shifts.
+STEP_SHIFTS = []
+JUMP_SHIFTS = []
+for _d in range(4):
+    _pairs = {}
+    for _sq in range(SQUARES):
+        if STEP[_d][_sq] != -1:
+            _delta = abs(STEP[_d][_sq] - _sq)
+            _pairs[_delta] = _pairs.get(_delta, 0) | (1 << _sq)
+    STEP_SHIFTS.append(tuple(_pairs.items()))
+    _jumpers = [_sq for _sq in range(SQUARES) if JUMP[_d][_sq] != -1]
+    JUMP_SHIFTS.append((abs(JUMP[_d][_jumpers[0]] - _jumpers[0]), sum(1 << _sq for _sq in _jumpers)))
+
+BLACK_KING_ROW = sum(1 << square(0, col) for col in range(1, COLS, 2))
+WHITE_KING_ROW = sum(1 << square(ROWS - 1, col) for col in range(0, COLS, 2))
+
+
+def shift(bits, direction, pairs):
+    """Moves every set bit one step (or one jump) in the given direction"""
+    result = 0
+    if direction in UP:
+        for delta, mask in pairs:
+            result |= (bits & mask) >> delta
+    else:
+        for delta, mask in pairs:
+            result |= (bits & mask) << delta
+    return result
+
+
+def shift_back(bits, direction, pairs):
+    """Inverse of shift: returns the squares from which a step (or jump) lands on the set bits"""
+    result = 0
+    if direction in UP:
+        for delta, mask in pairs:
+            result |= (bits << delta) & mask
+    else:
+        for delta, mask in pairs:
+            result |= (bits >> delta) & mask
+    return result
+
+
+def iter_bits(bits):
+    """Yields the square numbers of the set bits"""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+BitPiece = namedtuple('BitPiece', ['row', 'col', 'color', 'king'])
+
+
+class MoveCache(OrderedDict):
+    """Legal moves of the positions seen last, by (Zobrist key, side). When it is full the position that was
+    used longest ago is dropped, so the positions the search keeps coming back to stay in it."""
+
+    def __init__(self, size=MOVE_CACHE_SIZE):
+        super().__init__()
+        self.size = size
+
+    def lookup(self, key):
+        """Method to return the moves stored for the key, or None, and mark them as used"""
+        moves = self.get(key)
+        if moves is not None:
+            self.move_to_end(key)
+        return moves
+
+    def store(self, key, moves):
+        """Method to store the moves for the key, returns them"""
+        self[key] = moves
+        if len(self) > self.size:
+            self.popitem(last=False)
+        return moves
+
+
+class BitBoard:
+    """Compact board representation for the search: one mask for black, one for white and one for kings.
+
+    It exposes the same interface as checkers.board.Board, so the engine can run on either of them.
+    Moves are generated for the whole side at once with shifts and masks. A jump sequence is generated as
+    one move that ends on its last landing square; a man that is crowned during a jump stops there.
+    Capturing is compulsory: when a side can jump, its other moves are not legal.
+    """
+
+    def __init__(self, black=0, white=0, kings=0, turn=BLACK):
+        self.black = black
+        self.white = white
+        self.kings = kings
+        self.turn = turn
+
+        # Zobrist key of the position, kept up to date by move and remove
+        self.key = SIDE_KEY if turn != BLACK else 0
+        for sq in iter_bits(black | white):
+            self.key ^= self._piece_key(sq)
+
+        # legal moves of the positions seen last, by (Zobrist key, side)
+        self._moves = MoveCache()
+
+    def _piece_key(self, sq):
+        """Returns the Zobrist number of the piece on the square"""
+        return PIECE_KEYS[(0 if self.black >> sq & 1 else 2) + (self.kings >> sq & 1)][sq]
+
+    @classmethod
+    def from_board(cls, board, turn=BLACK):
+        """Builds the bitboard of a checkers.board.Board position"""
+        black = white = kings = 0
+        for row in range(ROWS):
+            for col in range(COLS):
+                piece = board.get_piece(row, col)
+                if piece != 0:
+                    bit = 1 << square(row, col)
+                    if piece.color == BLACK:
+                        black |= bit
+                    else:
+                        white |= bit
+                    if piece.king:
+                        kings |= bit
+        return cls(black, white, kings, turn)
+
+    def to_board(self):
+        """Converts the position back to a checkers.board.Board"""
+        from checkers.board import Board
+        from checkers.piece import Piece
+
+        board = Board()
+        for row in range(ROWS):
+            for col in range(COLS):
+                board.board[row][col] = 0
+        for sq in iter_bits(self.black | self.white):
+            row, col = SQUARE_TO_ROW_COL[sq]
+            piece = Piece(row, col, BLACK if self.black >> sq & 1 else WHITE)
+            if self.kings >> sq & 1:
+                piece.make_king()
+            board.board[row][col] = piece
+        board.black_left, board.white_left = self.black_left, self.white_left
+        board.black_kings, board.white_kings = self.black_kings, self.white_kings
+        board.key = self.key
+        return board
+
+    @property
+    def black_left(self):
+        return self.black.bit_count()
+
+    @property
+    def white_left(self):
+        return self.white.bit_count()
+
+    @property
+    def black_kings(self):
+        return (self.black & self.kings).bit_count()
+
+    @property
+    def white_kings(self):
+        return (self.white & self.kings).bit_count()
+
+    @property
+    def board(self):
+        """8x8 grid view of the position, built on demand"""
+        grid = [[0] * COLS for _ in range(ROWS)]
+        for sq in iter_bits(self.black | self.white):
+            row, col = SQUARE_TO_ROW_COL[sq]
+            grid[row][col] = self._piece_at(sq)
+        return grid
+
+    def _piece_at(self, sq):
+        row, col = SQUARE_TO_ROW_COL[sq]
+        color = BLACK if self.black >> sq & 1 else WHITE
+        return BitPiece(row, col, color, bool(self.kings >> sq & 1))
+
+    def get_piece(self, row, col):
+        if (row + col) % 2 == 0:
+            return 0
+        sq = square(row, col)
+        if not (self.black | self.white) >> sq & 1:
+            return 0
+        return self._piece_at(sq)
+
+    def get_pieces(self, color):
+        own = self.black if color == BLACK else self.white
+        return [self._piece_at(sq) for sq in iter_bits(own)]
+
+    def move(self, piece, row, col):
+        self._move(square(piece.row, piece.col), square(row, col))
+
+    def _move(self, start_sq, end_sq):
+        start, end = 1 << start_sq, 1 << end_sq
+        self.key ^= self._piece_key(start_sq)
+        # a king's jump sequence may end on the square it started from, then the piece stays where it is
+        if self.black & start:
+            self.black ^= start ^ end
+            king_row = BLACK_KING_ROW
+        else:
+            self.white ^= start ^ end
+            king_row = WHITE_KING_ROW
+        if self.kings & start:
+            self.kings ^= start ^ end
+        elif end & king_row:
+            self.kings |= end
+        self.key ^= self._piece_key(end_sq) ^ SIDE_KEY
+        self.turn = WHITE if self.turn == BLACK else BLACK
+
+    def remove(self, pieces):
+        for piece in pieces:
+            if piece != 0:
+                sq = square(piece.row, piece.col)
+                bit = 1 << sq
+                if not (self.black | self.white) & bit:
+                    continue
+                self.key ^= self._piece_key(sq)
+                self.black &= ~bit
+                self.white &= ~bit
+                self.kings &= ~bit
+
+    def make_move(self, piece, move, skip):
+        """Plays the move and returns the record that unmake_move needs to take it back"""
+        captured = 0
+        for skipped in skip:
+            captured |= 1 << square(skipped.row, skipped.col)
+        return self.play(square(piece.row, piece.col), square(*move), captured)
+
+    def play(self, start, end, captured):
+        """Plays a move given as squares (as returned by generate_moves), returns the record for unmake_move"""
+        undo = (self.black, self.white, self.kings, self.turn, self.key)
+        if captured:
+            for sq in iter_bits(captured):
+                self.key ^= self._piece_key(sq)
+            self.black &= ~captured
+            self.white &= ~captured
+            self.kings &= ~captured
+        self._move(start, end)
+        return undo
+
+    def unmake_move(self, undo):
+        """Restores the position from before make_move"""
+        self.black, self.white, self.kings, self.turn, self.key = undo
+
+    @property
+    def winner(self):
+        if not self.black:
+            return WHITE
+        elif not self.white:
+            return BLACK
+        return None
+
+    def generate_moves(self, color):
+        """Returns the legal moves of the side as (start square, end square, mask of captured squares).
+        The quiet moves are only generated when the side has no capture."""
+        return self.generate_captures(color) or self.generate_quiet_moves(color)
+
+    def has_any_move(self, color):
+        """Returns whether the side can move, without generating the moves"""
+        cached = self._moves.get((self.key, color))
+        if cached is not None:
+            return bool(cached[1])
+        own, opponent = self._sides(color)
+        empty = ~(self.black | self.white) & FULL
+        for direction, pieces in self._movers(own, color):
+            if pieces & shift_back(empty, direction, STEP_SHIFTS[direction]):
+                return True
+        return bool(self._jumpers(color))
+
+    def has_captures(self, color):
+        """Returns whether the side has a capture, i.e. whether its moves are all captures"""
+        cached = self._moves.get((self.key, color))
+        if cached is not None:
+            return bool(cached[1]) and bool(cached[1][0][1][1])
+        return bool(self._jumpers(color))
+
+    def _jumpers(self, color):
+        """Returns the mask of the pieces of the side that can start a jump"""
+        own, opponent = self._sides(color)
+        empty = ~(self.black | self.white) & FULL
+        jumpers = 0
+        for direction, pieces in self._movers(own, color):
+            # the piece must have an opponent next to it and an empty square behind that piece
+            jumpers |= (pieces & shift_back(opponent, direction, STEP_SHIFTS[direction])
+                        & shift_back(empty, direction, (JUMP_SHIFTS[direction],)))
+        return jumpers
+
+    def generate_quiet_moves(self, color):
+        """Returns the non-capturing moves of the side, found with one shift per direction"""
+        own, _ = self._sides(color)
+        empty = ~(self.black | self.white) & FULL
+        moves = []
+        for direction, pieces in self._movers(own, color):
+            movers = pieces & shift_back(empty, direction, STEP_SHIFTS[direction])
+            step = STEP[direction]
+            for sq in iter_bits(movers):
+                moves.append((sq, step[sq], 0))
+        return moves
+
+    def generate_captures(self, color):
+        """Returns the jump sequences of the side"""
+        own, opponent = self._sides(color)
+        empty = ~(self.black | self.white) & FULL
+        moves = []
+        for sq in iter_bits(self._jumpers(color)):
+            king = bool(self.kings >> sq & 1)
+            # the jumping piece leaves its square, so it can pass over it again later in the sequence
+            self._extend_jump(sq, sq, 0, king, color, opponent, empty | (1 << sq), moves)
+        return moves
+
+    def _extend_jump(self, start, sq, captured, king, color, opponent, empty, moves):
+        directions = ALL if king else (UP if color == BLACK else DOWN)
+        king_row = BLACK_KING_ROW if color == BLACK else WHITE_KING_ROW
+        extended = False
+        for direction in directions:
+            over = STEP[direction][sq]
+            land = JUMP[direction][sq]
+            if land == -1 or not opponent >> over & 1 or captured >> over & 1 or not empty >> land & 1:
+                continue
+            extended = True
+            now_captured = captured | (1 << over)
+            if not king and (1 << land) & king_row:
+                moves.append((start, land, now_captured))
+            else:
+                self._extend_jump(start, land, now_captured, king, color, opponent, empty, moves)
+        # a king that jumps round a loop finds the same sequence in both directions
+        if not extended and captured and (start, sq, captured) not in moves:
+            moves.append((start, sq, captured))
+
+    def _sides(self, color):
+        if color == BLACK:
+            return self.black, self.white
+        return self.white, self.black
+
+    def _movers(self, own, color):
+        """Yields every direction together with the pieces of the side that may move in it"""
+        kings = own & self.kings
+        forward, backward = (UP, DOWN) if color == BLACK else (DOWN, UP)
+        for direction in forward:
+            yield direction, own
+        if kings:
+            for direction in backward:
+                yield direction, kings
+
+    def legal_moves(self, color):
+        """Returns the legal moves of the side as ({start square: moves in the format of get_valid_moves},
+        list in the format of get_all_valid_moves).
+
+        The moves are generated once per position and side and cached against the Zobrist key (see MoveCache),
+        so the search finds them again when it returns to a position. The result is shared, callers must not
+        change it.
+        """
+        cache_key = (self.key, color)
+        cached = self._moves.lookup(cache_key)
+        if cached is not None:
+            return cached
+
+        by_square = {}
+        for start, end, captured in self.generate_moves(color):
+            moves = by_square.setdefault(start, {})
+            skipped = [self._piece_at(sq) for sq in iter_bits(captured)]
+            key = SQUARE_TO_ROW_COL[end]
+            # two jump sequences may end on the same square, keep the one that captures more
+            if len(skipped) >= len(moves.get(key, ())):
+                moves[key] = skipped
+        all_moves = []
+        for sq, piece_moves in sorted(by_square.items()):
+            piece = self._piece_at(sq)
+            for move in piece_moves.items():
+                all_moves.append((piece, move))
+
+        return self._moves.store(cache_key, (by_square, all_moves))
+
+    def get_valid_moves(self, piece):
+        return self.legal_moves(piece.color)[0].get(square(piece.row, piece.col), {})
+
+    def get_all_valid_moves(self, color):
+        return self.legal_moves(color)[1]
+
+    def __getstate__(self):
+        # the move cache is neither copied nor sent to other processes, it fills up again on demand
+        state = self.__dict__.copy()
+        state['_moves'] = MoveCache()
+        return state
+
+    def __eq__(self, other):
+        if not isinstance(other, BitBoard):
+            return NotImplemented
+        return (self.black, self.white, self.kings, self.turn) == (other.black, other.white, other.kings, other.turn)
+
+    def __hash__(self):
+        return hash((self.black, self.white, self.kings, self.turn))
+
+    def to_fen(self):
+        """Returns the position as text, e.g. 'B:W1,2,K7:B25,K30': side to move, then the squares of the white
+        and the black pieces, K marks a king. Squares are numbered 1 to 32 row by row from row 0."""
+        def squares(pieces):
+            return ','.join(('K' if self.kings >> sq & 1 else '') + str(sq + 1) for sq in iter_bits(pieces))
+
+        return f"{'B' if self.turn == BLACK else 'W'}:W{squares(self.white)}:B{squares(self.black)}"
+
+    @classmethod
+    def from_fen(cls, fen):
+        """Builds the position from the text returned by to_fen"""
+        try:
+            side, *sides = fen.strip().split(':')
+            masks = {'W': [0, 0], 'B': [0, 0]}
+            for pieces in sides:
+                for token in filter(None, pieces[1:].split(',')):
+                    sq = int(token.lstrip('K')) - 1
+                    if not 0 <= sq < SQUARES:
+                        raise ValueError(f'square {token} is off the board')
+                    masks[pieces[0]][0] |= 1 << sq
+                    if token.startswith('K'):
+                        masks[pieces[0]][1] |= 1 << sq
+            turn = {'B': BLACK, 'W': WHITE}[side]
+        except (KeyError, IndexError, ValueError) as error:
+            raise ValueError(f'invalid position {fen!r}: {error}')
+        return cls(masks['B'][0], masks['W'][0], masks['B'][1] | masks['W'][1], turn)
+
+    def __repr__(self):
+        return f'BitBoard(black={self.black:#010x}, white={self.white:#010x}, kings={self.kings:#010x})'
@@ -1,13 +1,7 @@
-import pygame
-
-from checkers.constants import ROWS, BLACK, SQUARE_SIZE, COLS, WHITE, GREY
+from checkers.bitboard import BitBoard, MoveCache, SQUARE_TO_ROW_COL, square
+from checkers.constants import ROWS, BLACK, COLS, WHITE
 from checkers.piece import Piece
-from enum import Enum
-
-
-class Direction(Enum):
-    LEFT = 'left'
-    RIGHT = 'right'
+from checkers.zobrist import PIECE_KEYS, SIDE_KEY, piece_index
 
 
 class Board:
@@ -17,23 +11,31 @@ class Board:
         self.black_kings = self.white_kings = 0
         self.create_board()
 
+        # Zobrist key of the position, kept up to date by move and remove. Black moves first.
+        self.key = 0
+        for piece in self.get_pieces(BLACK) + self.get_pieces(WHITE):
+            self.key ^= self.piece_key(piece)
+
+        # legal moves of the positions seen last, by (Zobrist key, side)
+        self._moves = MoveCache()
+
     @staticmethod
-    def draw_squares(win):
-        win.fill(GREY)
-        for row in range(ROWS):
-            for col in range(row % 2, COLS, 2):
-                pygame.draw.rect(win, WHITE, (row * SQUARE_SIZE, col * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
+    def piece_key(piece):
+        """Returns the Zobrist number of the piece on its current square"""
+        return PIECE_KEYS[piece_index(piece.color, piece.king)][square(piece.row, piece.col)]
 
     def move(self, piece, row, col):
+        self.key ^= self.piece_key(piece)
         self.board[piece.row][piece.col], self.board[row][col] = self.board[row][col], self.board[piece.row][piece.col]
         piece.move(row, col)
 
-        if row == ROWS - 1 or row == 0:
+        if (row == ROWS - 1 or row == 0) and not piece.king:
             piece.make_king()
             if piece.color == WHITE:
                 self.white_kings += 1
             else:
                 self.black_kings += 1
+        self.key ^= self.piece_key(piece) ^ SIDE_KEY
 
     def get_piece(self, row, col):
         return self.board[row][col]
@@ -61,22 +63,37 @@ class Board:
                 else:
                     self.board[row].append(0)
 
-    def draw(self, win):
-        self.draw_squares(win)
-        for row in range(ROWS):
-            for col in range(COLS):
-                piece = self.board[row][col]
-                if piece != 0:
-                    piece.draw(win)
-
     def remove(self, pieces):
         for piece in pieces:
             self.board[piece.row][piece.col] = 0
             if piece != 0:
+                self.key ^= self.piece_key(piece)
                 if piece.color == BLACK:
                     self.black_left -= 1
+                    self.black_kings -= piece.king
                 else:
                     self.white_left -= 1
+                    self.white_kings -= piece.king
+
+    def make_move(self, piece, move, skip):
+        """Plays the move and returns the record that unmake_move needs to take it back"""
+        undo = (piece, piece.row, piece.col, piece.king, list(skip), self.key,
+                self.black_left, self.white_left, self.black_kings, self.white_kings)
+        self.move(piece, *move)
+        if skip:
+            self.remove(skip)
+        return undo
+
+    def unmake_move(self, undo):
+        """Restores the position from before make_move, including captured pieces and crowned kings"""
+        (piece, row, col, king, skipped, self.key,
+         self.black_left, self.white_left, self.black_kings, self.white_kings) = undo
+        self.board[piece.row][piece.col] = 0
+        self.board[row][col] = piece
+        piece.move(row, col)
+        piece.king = king
+        for captured in skipped:
+            self.board[captured.row][captured.col] = captured
 
     @property
     def winner(self):
@@ -86,70 +103,41 @@ class Board:
             return BLACK
         return None
 
-    def get_valid_moves(self, piece):
-        moves = {}
-        left = piece.col - 1
-        right = piece.col + 1
-        row = piece.row
-
-        if piece.color == BLACK or piece.king:
-            moves.update(self._traverse(row - 1, max(row - 3, -1), -1, piece.color, left, Direction.LEFT))
-            moves.update(self._traverse(row - 1, max(row - 3, -1), -1, piece.color, right, Direction.RIGHT))
-        if piece.color == WHITE or piece.king:
-            moves.update(self._traverse(row + 1, min(row + 3, ROWS), 1, piece.color, left, Direction.LEFT))
-            moves.update(self._traverse(row + 1, min(row + 3, ROWS), 1, piece.color, right, Direction.RIGHT))
+    def _legal_moves(self, color):
+        """Returns the legal moves of the side by start square. They are generated by the BitBoard of the
+        position, so the board follows the same rules as the engine, and cached against the Zobrist key."""
+        cache_key = (self.key, color)
+        moves = self._moves.lookup(cache_key)
+        if moves is None:
+            moves = self._moves.store(cache_key, BitBoard.from_board(self, color).legal_moves(color)[0])
         return moves
 
-    def get_all_valid_moves(self, color):
-        moves = []
-        for piece in self.get_pieces(color):
-            for move in self.get_valid_moves(piece).items():
-                moves.append((piece, move))
-        return moves
+    def _skipped(self, skipped):
+        """Returns the pieces of this board on the squares of the skipped pieces"""
+        return [self.board[piece.row][piece.col] for piece in skipped]
 
-    def _traverse(self, start, stop, step, color, direction_num, direction, skipped=None):
-        if skipped is None:
-            skipped = []
-        moves = {}
-        last = []
-
-        for r in range(start, stop, step):
-            if direction == Direction.RIGHT:
-                if direction_num >= COLS:
-                    break
-            elif direction == Direction.LEFT:
-                if direction_num < 0:
-                    break
-
-            current = self.board[r][direction_num]
-            if current == 0:
-                if skipped and not last:
-                    break
-                elif skipped:
-                    moves[(r, direction_num)] = last + skipped
-                else:
-                    moves[(r, direction_num)] = last
+    def has_any_move(self, color):
+        moves = self._moves.get((self.key, color))
+        if moves is not None:
+            return bool(moves)
+        return BitBoard.from_board(self, color).has_any_move(color)
 
-                if last:
-                    if step == -1:
-                        row = max(r - 3, -1)
-                    else:
-                        row = min(r + 3, ROWS)
-                    moves.update(self._traverse(r + step, row, step, color, direction_num - 1, Direction.LEFT,
-                                                skipped=last))
-                    moves.update(self._traverse(r + step, row, step, color, direction_num + 1, Direction.RIGHT,
-                                                skipped=last))
-                break
-            elif current.color == color:
-                break
-            else:
-                last = [current]
+    def has_captures(self, color):
+        moves = self._moves.get((self.key, color))
+        if moves is not None:
+            return any(skipped for piece_moves in moves.values() for skipped in piece_moves.values())
+        return BitBoard.from_board(self, color).has_captures(color)
 
-            if direction == Direction.RIGHT:
-                direction_num += 1
-            elif direction == Direction.LEFT:
-                direction_num -= 1
+    def get_valid_moves(self, piece):
+        moves = self._legal_moves(piece.color).get(square(piece.row, piece.col), {})
+        return {move: self._skipped(skipped) for move, skipped in moves.items()}
 
+    def get_all_valid_moves(self, color):
+        moves = []
+        for sq, piece_moves in sorted(self._legal_moves(color).items()):
+            piece = self.board[SQUARE_TO_ROW_COL[sq][0]][SQUARE_TO_ROW_COL[sq][1]]
+            for move, skipped in piece_moves.items():
+                moves.append((piece, (move, self._skipped(skipped))))
         return moves
 
     def __eq__(self, other):
@@ -1,5 +1,3 @@
-import pygame
-
 WIDTH, HEIGHT = 800, 800
 ROWS, COLS = 8, 8
 SQUARE_SIZE = WIDTH // COLS
@@ -7,13 +5,29 @@ ABOUT = [f'Author: Evgeniia Buzulukova',
          f'Email: evgeniia@uni.minerva.edu']
 DIFFICULTY = ['EASY']
 FPS = 60
-TRANSPOSITION_TABLE_FILENAME = "ttable.pkl"
+TRANSPOSITION_TABLE_FILENAME = "ttable.bin"
+ZOBRIST_SEED = 20211
+TRANSPOSITION_TABLE_SIZE_MB = 16
+TABLEBASE_FILENAME = "endgame.cktb"
+OPENING_BOOK_FILENAME = "book.ckob"
+# positions whose legal moves a board keeps (checkers.bitboard.MoveCache), about 1-2 KB each
+MOVE_CACHE_SIZE = 2**12
+
+# a game is drawn when a position comes back for the third time, or after 40 moves of each side without a capture
+# or a man move
+DRAW_REPETITIONS = 3
+DRAW_PLIES = 80
+
+# headless games (engine matches, self-play) that last longer than this are counted as draws
+MAX_PLIES = 200
 GAME_NAME = 'Checkers'
 
+# sides, also used as indexes
+BLACK, WHITE = 0, 1
+
 # rgb
-WHITE = (255, 255, 255)
-BLACK = (0, 0, 0)
+WHITE_RGB = (255, 255, 255)
+BLACK_RGB = (0, 0, 0)
+SIDE_RGB = (BLACK_RGB, WHITE_RGB)
 BLUE = (0, 0, 255)
 GREY = (128, 128, 128)
-
-CROWN = pygame.transform.scale(pygame.image.load('assets/img.png'), (44, 25))
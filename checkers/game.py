@@ -1,30 +1,31 @@
-import pygame
-
 from checkers.board import Board
-from checkers.constants import BLACK, WHITE, BLUE, SQUARE_SIZE
+from checkers.constants import BLACK, DRAW_PLIES, WHITE
+from checkers.history import PositionHistory
 
 
 class Game:
-    def __init__(self, win):
+    """State of a game: the board, the side to move and the selected piece. Drawing it is done by ui.render."""
+
+    def __init__(self, win=None, draw_plies=DRAW_PLIES):
         self.win = win
         self.valid_moves = {}
         self.selected = None
         self.turn = BLACK
         self.board = Board()
         self.winner = None
-
-    def update(self):
-        self.board.draw(self.win)
-        self.draw_valid_moves(self.valid_moves)
-        pygame.display.update()
+        self.history = PositionHistory(self.board.key, draw_plies)
 
     @property
     def get_winner(self):
         self.winner = self.board.winner
         return self.winner
 
+    @property
+    def is_draw(self):
+        return self.history.is_draw
+
     def reset(self):
-        self.__init__(self.win)
+        self.__init__(self.win, self.history.draw_plies)
 
     def select(self, row, col):
         if self.selected:
@@ -43,22 +44,29 @@ class Game:
 
     def _move(self, row, col):
         piece = self.board.get_piece(row, col)
-        if self.selected and piece == 0 and (row, col) in self.valid_moves:
+        # a king's capture loop ends on the square of the selected piece itself
+        if self.selected and (piece == 0 or piece is self.selected) and (row, col) in self.valid_moves:
+            irreversible = not self.selected.king
             self.board.move(self.selected, row, col)
             skipped = self.valid_moves[(row, col)]
             if skipped:
                 self.board.remove(skipped)
+            self.history.push(self.board.key, irreversible or bool(skipped))
             self.change_turn()
         else:
             return False
 
         return True
 
-    def draw_valid_moves(self, moves):
-        for move in moves:
-            row, col = move
-            pygame.draw.circle(self.win, BLUE, (col * SQUARE_SIZE + SQUARE_SIZE // 2,
-                                                row * SQUARE_SIZE + SQUARE_SIZE // 2), 15)
+    def apply_move(self, move):
+        """Plays a move found on another board instance (e.g. the bitboard) and passes the turn"""
+        piece, (row, col), skip = move
+        piece = self.board.get_piece(piece.row, piece.col)
+        skipped = [self.board.get_piece(captured.row, captured.col) for captured in skip]
+        irreversible = not piece.king or bool(skipped)
+        self.board.make_move(piece, (row, col), skipped)
+        self.history.push(self.board.key, irreversible)
+        self.change_turn()
 
     def change_turn(self):
         self.valid_moves = {}
@@ -0,0 +1,35 @@
+from collections import Counter
+
+from checkers.constants import DRAW_PLIES, DRAW_REPETITIONS
+
+
+class PositionHistory:
+    """This class keeps the Zobrist keys of the positions of a game since its last irreversible move (a capture or
+    a man move), the only positions that can come back.
+
+    The game is drawn when a position comes back for the DRAW_REPETITIONS-th time, or after draw_plies plies
+    without an irreversible move (None for no limit).
+    """
+
+    def __init__(self, key, draw_plies=DRAW_PLIES):
+        self.draw_plies = draw_plies
+        self.keys = [key]
+        self.counts = Counter(self.keys)
+
+    def push(self, key, irreversible):
+        """Method to record the position after a move"""
+        if irreversible:
+            self.keys.clear()
+            self.counts.clear()
+        self.keys.append(key)
+        self.counts[key] += 1
+
+    @property
+    def quiet_plies(self):
+        """Number of plies since the last capture or man move"""
+        return len(self.keys) - 1
+
+    @property
+    def is_draw(self):
+        return self.counts[self.keys[-1]] >= DRAW_REPETITIONS or \
+            self.draw_plies is not None and self.quiet_plies >= self.draw_plies
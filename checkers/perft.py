@@ -0,0 +1,23 @@
+from checkers.constants import BLACK, WHITE
+
+
+def perft(board, depth, color=None):
+    """Counts the leaf nodes of the move tree of the given depth (performance test of the move generator).
+
+    The board must be a BitBoard; color defaults to its side to move. The board is left unchanged.
+    """
+    if color is None:
+        color = board.turn
+    if depth == 0:
+        return 1
+    moves = board.generate_moves(color)
+    if depth == 1:
+        return len(moves)
+
+    opponent = WHITE if color == BLACK else BLACK
+    nodes = 0
+    for move in moves:
+        undo = board.play(*move)
+        nodes += perft(board, depth - 1, opponent)
+        board.unmake_move(undo)
+    return nodes
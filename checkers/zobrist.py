@@ -0,0 +1,21 @@
+import random
+
+from checkers.constants import ZOBRIST_SEED
+
+# I took the idea of Zobrist Hashing from https://iq.opengenus.org/zobrist-hashing-game-theory/
+# Zobrist Hashing: every (piece type, square) pair gets a random 64-bit number and the key of a position is
+# the xor of the numbers of its pieces, so a move changes the key with a couple of xors.
+# The numbers are generated from a fixed seed, so the keys are the same in every run.
+# Squares are the 32 dark squares as numbered in checkers.bitboard.
+_random = random.Random(ZOBRIST_SEED)
+
+# PIECE_KEYS[piece_index(color, king)][square]
+PIECE_KEYS = [[_random.getrandbits(64) for _ in range(32)] for _ in range(4)]
+
+# xor'ed into the key when white is to move
+SIDE_KEY = _random.getrandbits(64)
+
+
+def piece_index(color, king):
+    """Returns the index of the piece type: black man, black king, white man, white king"""
+    return color * 2 + king
@@ -1,12 +1,12 @@
-import random
-
 import pygame
 import pygame_menu
 
 from checkers.constants import WIDTH, HEIGHT, SQUARE_SIZE, WHITE, BLACK, ABOUT, FPS, DIFFICULTY, GAME_NAME
+from checkers.bitboard import BitBoard
 from checkers.game import Game
-from negamax.negamax import negamax
-from negamax.transposition_table import TranspositionTable
+from negamax.book import OpeningBook
+from negamax.worker import SearchWorker
+from ui.render import BoardRenderer
 from enum import Enum
 
 
@@ -16,11 +16,16 @@ class Difficulty(Enum):
     HARD = 'hard'
 
 
-clock, main_menu, surface = None, None, None
+# seconds the AI may think about a move at each difficulty
+TIME_BUDGET = {Difficulty.EASY.name: 0.05,
+               Difficulty.MEDIUM.name: 0.3,
+               Difficulty.HARD.name: 1.5}
+
+# at these difficulties book moves are picked at random, weighted by how often they were played
+WEIGHTED_BOOK = {Difficulty.EASY.name, Difficulty.MEDIUM.name}
 
-pygame.init()
-WIN = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption(GAME_NAME)
+# the window is opened in main(), so the search worker process does not open one when it imports this module
+clock, main_menu, surface, WIN = None, None, None, None
 
 
 def get_row_col_from_mouse(pos):
@@ -30,22 +35,9 @@ def get_row_col_from_mouse(pos):
     return row, col
 
 
-def random_move(game):
-    piece, move = random.choice(game.board.get_all_valid_moves(WHITE))
-    if len(move[1]) > 0:
-        game.board.remove(move[1])
-    pygame.time.delay(1000)
-    game.board.move(piece, move[0][0], move[0][1])
-
-
 def has_move(game, run, color):
-    have_move = False
-    for piece in game.board.get_pieces(color):
-        for _ in game.board.get_valid_moves(piece).items():
-            have_move = True
-            break
     winner = game.get_winner
-    if not have_move:
+    if not game.board.has_any_move(color):
         color = WHITE if color == BLACK else BLACK
         game.winner = color
         winner = game.winner
@@ -67,48 +59,64 @@ def run_game(difficulty):
 
     run = True
     game = Game(WIN)
-    transposition_table = TranspositionTable()
-    transposition_table.from_file()
+    worker = SearchWorker()
+
+    # only the squares that changed are drawn, an idle frame costs nothing
+    renderer = BoardRenderer(WIN)
+    pondering = False
+
+    # the opening book is optional, it is built with python -m negamax.book
+    book = OpeningBook()
+    book.from_file()
 
     while run:
         clock.tick(FPS)
-        alpha = float("-inf")
-        beta = float("inf")
         if game.turn == WHITE:
-            winner, run = has_move(game, run, WHITE)
-            if difficulty == Difficulty.EASY.name:
-                if random.random() < 0.3:
-                    value, next_board = negamax(game.board, 5, WHITE, 1, game, alpha, beta, transposition_table)
-                    game.board = next_board
-                else:
-                    random_move(game)
-            elif difficulty == Difficulty.MEDIUM.name:
-                if random.random() < 0.7:
-                    value, next_board = negamax(game.board, 5, WHITE, 1, game, alpha, beta, transposition_table)
-                    game.board = next_board
-                else:
-                    random_move(game)
+            if not worker.thinking:
+                winner, run = has_move(game, run, WHITE)
+                book_move = book.choose(game.board, WHITE, difficulty in WEIGHTED_BOOK) if run else None
+                if book_move is not None:
+                    # book moves are played at once, without a search
+                    worker.cancel()
+                    game.apply_move(book_move)
+                    pondering = False
+                elif run:
+                    # the search runs on the compact bitboard in the worker process, the loop keeps drawing
+                    worker.search(BitBoard.from_board(game.board, WHITE), WHITE, time_limit=TIME_BUDGET[difficulty],
+                                  history=game.history.keys)
             else:
-                value, next_board = negamax(game.board, 5, WHITE, 1, game, alpha, beta, transposition_table)
-                game.board = next_board
-            game.change_turn()
+                result = worker.poll()
+                if result is not None:
+                    value, move, depth = result
+                    if move is not None:
+                        game.apply_move(move)
+                    else:
+                        # the AI has no legal move, which loses the game like in has_move
+                        game.winner = winner = BLACK
+                        run = False
+                    pondering = False
 
         if game.get_winner is not None:
             winner = game.get_winner
             run = False
+        elif game.is_draw:
+            winner = None
+            run = False
 
         events = pygame.event.get()
         for event in events:
             if event.type == pygame.QUIT:
                 exit()
 
-            if event.type == pygame.MOUSEBUTTONDOWN:
+            if event.type == pygame.MOUSEBUTTONDOWN and game.turn == BLACK:
                 pos = pygame.mouse.get_pos()
                 row, col = get_row_col_from_mouse(pos)
                 game.select(row, col)
 
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
+                    # stops the search the AI may be running
+                    worker.close(save=False)
                     main_menu.enable()
 
                     # Quit this function, then skip to loop of main-menu on line 224
@@ -120,9 +128,14 @@ def run_game(difficulty):
         if game.turn == BLACK:
             winner, run = has_move(game, run, BLACK)
 
-        game.update()
+            # the AI thinks on the human's time, its transposition table is then warm for the reply
+            if run and not pondering:
+                worker.ponder(BitBoard.from_board(game.board, BLACK), BLACK, history=game.history.keys)
+                pondering = True
+
+        renderer.draw(game.board, game.valid_moves, worker.thinking)
 
-    transposition_table.to_file()
+    worker.close()
 
     game_over_theme = pygame_menu.themes.THEME_DEFAULT.copy()
     game_over_theme.widget_margin = (0, 0)
@@ -137,8 +150,10 @@ def run_game(difficulty):
 
     if winner == WHITE:
         winner_statement = 'AI wins!'
-    else:
+    elif winner == BLACK:
         winner_statement = 'Human wins!'
+    else:
+        winner_statement = 'Draw!'
 
     game_over_menu.add.label(winner_statement, align=pygame_menu.locals.ALIGN_CENTER, font_size=30)
     game_over_menu.add.vertical_margin(30)
@@ -167,6 +182,11 @@ def main():
     global clock
     global main_menu
     global surface
+    global WIN
+
+    pygame.init()
+    WIN = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption(GAME_NAME)
 
     clock = pygame.time.Clock()
     surface = WIN
@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from os.path import exists
+
+from checkers.bitboard import BitBoard, square
+from checkers.constants import BLACK, WHITE
+from negamax.match import DEFAULT_ENGINE, Engine, engine_config, notation
+from negamax.ordering import MoveOrdering
+from negamax.search import MAX_DEPTH, SearchContext, iterative_deepening
+
+# Binary position files: a header, then one fixed-size record per position, so a run can seek to any position.
+# Text position files hold one position per line in the notation of BitBoard.to_fen; empty lines and lines
+# starting with '#' are skipped.
+MAGIC = b'CKPS'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHH')  # magic, version, reserved
+RECORD = struct.Struct('<IIIB')  # black, white, kings, side to move (0 black, 1 white)
+
+# records read from a binary file at once
+READ_CHUNK = 4096
+
+# engine of the process and the number of lines it reports, set once by the pool initializer
+_engine = None
+_multi_pv = 1
+
+
+def write_positions(boards, name):
+    """Writes the positions (BitBoards) to a binary position file, returns how many were written"""
+    count = 0
+    with open(name, 'wb') as a_file:
+        a_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0))
+        for board in boards:
+            a_file.write(RECORD.pack(board.black, board.white, board.kings, board.turn == WHITE))
+            count += 1
+    return count
+
+
+def read_positions(name, start=0):
+    """Yields (index, BitBoard) for the positions of a text or binary position file, from the start-th one on.
+    The file is read lazily, so it may hold any number of positions."""
+    with open(name, 'rb') as a_file:
+        if a_file.read(len(MAGIC)) == MAGIC:
+            a_file.seek(0)
+            _, version, _ = HEADER.unpack(a_file.read(HEADER.size))
+            if version != FORMAT_VERSION:
+                raise ValueError(f'{name}: unsupported position file version {version}')
+            a_file.seek(HEADER.size + start * RECORD.size)
+            index = start
+            while True:
+                chunk = a_file.read(RECORD.size * READ_CHUNK)
+                for black, white, kings, side in RECORD.iter_unpack(chunk[:len(chunk) - len(chunk) % RECORD.size]):
+                    yield index, BitBoard(black, white, kings, WHITE if side else BLACK)
+                    index += 1
+                if len(chunk) < RECORD.size * READ_CHUNK:
+                    return
+
+    index = 0
+    with open(name) as a_file:
+        for number, line in enumerate(a_file, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if index >= start:
+                try:
+                    yield index, BitBoard.from_fen(line)
+                except ValueError as error:
+                    raise ValueError(f'{name}:{number}: {error}')
+            index += 1
+
+
+def _start_worker(config, multi_pv):
+    global _engine, _multi_pv
+    _engine, _multi_pv = Engine(config), multi_pv
+
+
+def _move_notation(move):
+    piece, destination, skip = move
+    return notation(square(piece.row, piece.col), square(*destination),
+                    sum(1 << square(skipped.row, skipped.col) for skipped in skip))
+
+
+def _analyse(index, position):
+    """Analyses one position in a process of the pool, returns its record"""
+    board = BitBoard(*position)
+    config, transposition_table = _engine.config, _engine.transposition_table
+
+    # every position starts from empty tables, so its result does not depend on which process got it
+    transposition_table.clear()
+    context = SearchContext(config['time'], config['nodes'], MoveOrdering(), evaluator=_engine.evaluator,
+                            quiescence_depth=config['quiescence'], pvs=config['pvs'], aspiration=config['aspiration'],
+                            multi_pv=_multi_pv, lmr=config['lmr'], futility=config['futility'],
+                            razoring=config['razoring'])
+    started = time.perf_counter()
+    value, move, depth = iterative_deepening(board, board.turn, transposition_table, max_depth=config['depth'],
+                                             context=context)
+    seconds = time.perf_counter() - started
+
+    record = {'index': index, 'fen': board.to_fen(), 'move': _move_notation(move) if move is not None else None,
+              'score': value, 'depth': depth, 'pv': [_move_notation(step) for step in context.pv],
+              'nodes': context.nodes, 'seconds': seconds}
+    if _multi_pv > 1:
+        record['lines'] = [{'move': _move_notation(line_move), 'score': line_value,
+                            'pv': [_move_notation(step) for step in line]}
+                           for line_value, line_move, line in context.lines]
+    return record
+
+
+def analyse(positions, config, workers=None, window=None, multi_pv=1):
+    """This function analyses the (index, BitBoard) positions on a pool of processes and yields their records
+    (index, fen, move, score, depth, pv, nodes, seconds) in the order of the positions. The score is from the
+    point of view of the side to move. With multi_pv > 1 the records also hold the lines (move, score, pv) of the
+    multi_pv best moves. At most window positions are in flight, so memory stays flat however many positions
+    there are."""
+    workers = workers or os.cpu_count()
+    window = window or workers * 4
+    pool = ProcessPoolExecutor(workers, initializer=_start_worker, initargs=(config, multi_pv))
+    pending = deque()
+    try:
+        for index, board in positions:
+            pending.append(pool.submit(_analyse, index, (board.black, board.white, board.kings, board.turn)))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def completed(name):
+    """Returns how many records the output file already holds. A record cut off by an interrupted run is
+    removed, so the run resumes with its position."""
+    if not exists(name):
+        return 0
+    count = size = 0
+    with open(name, 'rb+') as a_file:
+        for line in a_file:
+            if not line.endswith(b'\n'):
+                break
+            count += 1
+            size += len(line)
+        a_file.truncate(size)
+    return count
+
+
+def run_analysis(source, output, config, workers=None, window=None, resume=True, multi_pv=1):
+    """Analyses the positions of the file source and appends their records to the file output as JSON lines.
+    With resume, the positions that output already has records for are skipped. Returns the number of positions
+    analysed by this run."""
+    start = completed(output) if resume else 0
+    count = 0
+    with open(output, 'a' if resume else 'w') as a_file:
+        for record in analyse(read_positions(source, start), config, workers, window, multi_pv):
+            a_file.write(json.dumps(record) + '\n')
+            a_file.flush()
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyses the positions of a file without a window and writes the '
+                                                 'best move, score, principal variation and nodes of each as JSON '
+                                                 'lines. An interrupted run is resumed by running it again.')
+    parser.add_argument('positions', help='position file: one position per line (see BitBoard.to_fen) or binary')
+    parser.add_argument('--output', default='analysis.jsonl', help='file the records are appended to')
+    parser.add_argument('--depth', type=int, help=f'search depth (default {DEFAULT_ENGINE["depth"]}, unlimited '
+                                                  f'with --time)')
+    parser.add_argument('--time', type=float, help='seconds per position')
+    parser.add_argument('--engine', type=engine_config, default='{}',
+                        help=f'JSON settings of the engine, keys: {", ".join(DEFAULT_ENGINE)}')
+    parser.add_argument('--multi-pv', type=int, default=1, help='also report the lines of this many best moves')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes')
+    parser.add_argument('--restart', action='store_true', help='overwrite the output instead of resuming')
+    parser.add_argument('--convert', metavar='FILE',
+                        help='only write the positions to FILE in the binary format, without analysing them')
+    args = parser.parse_args()
+
+    if args.convert:
+        count = write_positions((board for _, board in read_positions(args.positions)), args.convert)
+        print(f'{count} positions written to {args.convert}', file=sys.stderr)
+        return
+
+    config = dict(args.engine)
+    if args.time is not None:
+        config['time'] = args.time
+        config['depth'] = MAX_DEPTH
+    if args.depth is not None:
+        config['depth'] = args.depth
+
+    started = time.perf_counter()
+    count = run_analysis(args.positions, args.output, config, args.workers, resume=not args.restart,
+                         multi_pv=args.multi_pv)
+    print(f'{count} positions analysed in {time.perf_counter() - started:.1f} s', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from copy import deepcopy
+
+from checkers.bitboard import BitBoard
+from checkers.constants import WHITE
+from checkers.perft import perft
+from negamax.evaluation import Evaluator
+from negamax.negamax import evaluation_function
+from negamax.search import ASPIRATION_WINDOW, SearchContext, search_root
+from negamax.stats import SearchStats
+from negamax.transposition_table import TranspositionTable
+
+# Positions are in the notation of BitBoard.to_fen. The perft counts (captures are compulsory) were checked
+# against an independent square-by-square move generator.
+PERFT_POSITIONS = [
+    ('start', 'B:W1,2,3,4,5,6,7,8,9,10,11,12:B21,22,23,24,25,26,27,28,29,30,31,32',
+     (7, 49, 302, 1469, 7361, 36768)),
+    ('kings-middlegame', 'B:W11,K18,21,K30:BK5,12,13,K14,15,19,20,23',
+     (1, 2, 14, 90, 977, 5139)),
+    ('kings-endgame', 'W:W21,25,K26:BK3,K4,K8,29',
+     (5, 10, 41, 163, 757, 4130)),
+    ('mixed', 'B:W5,9,18,22,23,K25,K26:BK1,K3,K4,6,21,24',
+     (7, 50, 378, 2823, 21672, 168071)),
+    ('crowded', 'B:W4,5,15,16,17,18,19,20,25:BK1,K2,13,23,24,26,27,28,30,31',
+     (2, 10, 41, 158, 672, 2635)),
+]
+
+SEARCH_POSITIONS = [
+    ('middlegame-1', 'B:W2,3,5,6,7,8,9,10,11,14,K30:B13,15,17,19,20,21,24,26,28'),
+    ('middlegame-2', 'W:W1,2,3,5,6,10,11,19,21,22,K29:B9,20,23,25,27,31,32'),
+    ('middlegame-3', 'W:W3,7,9,12,13,14,15,16,28:BK1,17,18,20,21,22,25,27,30'),
+    ('endgame-1', 'B:W4,5,9,11,16,K22,K30:BK7,13,20'),
+    ('endgame-2', 'W:W21,25,K26:BK3,K4,K8,29'),
+    ('endgame-3', 'B:W1,K13,K30:BK2,K4,20'),
+]
+
+
+def run_perft(max_depth):
+    """Counts the leaf nodes of every perft position up to max_depth and compares them with the stored counts"""
+    results = []
+    for name, fen, expected in PERFT_POSITIONS:
+        board = BitBoard.from_fen(fen)
+        for depth, count in enumerate(expected[:max_depth], 1):
+            started = time.perf_counter()
+            nodes = perft(board, depth)
+            seconds = time.perf_counter() - started
+            results.append({'position': name, 'depth': depth, 'nodes': nodes, 'expected': count,
+                            'ok': nodes == count, 'seconds': seconds, 'nps': nodes / seconds if seconds else 0.0})
+    return results
+
+
+def search(board, depth, size_mb, stats=None, evaluator=None, pvs=True, aspiration=ASPIRATION_WINDOW,
+           selective=None):
+    """Runs iterations 1 to depth on a fresh table, returns the last result, the context, the table and the
+    time at which every depth was completed. selective turns the lmr, futility and razoring of the search on and
+    off, all are on by default."""
+    color = board.turn
+    color_num = 1 if color == WHITE else -1
+    transposition_table = TranspositionTable(size_mb)
+    context = SearchContext(stats=stats, evaluator=evaluator, pvs=pvs, aspiration=aspiration, **(selective or {}))
+    time_to_depth = []
+    value = None
+    started = time.perf_counter()
+    for iteration in range(1, depth + 1):
+        value, move = search_root(board, iteration, color, color_num, transposition_table, context, value)
+        time_to_depth.append(time.perf_counter() - started)
+    return (value, move), context, transposition_table, time_to_depth
+
+
+def run_search(depth, size_mb, memory=True, statistics=False, evaluator=None, pvs=True,
+               aspiration=ASPIRATION_WINDOW, selective=None):
+    """Times a fixed-depth search of every search position"""
+    results = []
+    for name, fen in SEARCH_POSITIONS:
+        board = BitBoard.from_fen(fen)
+        stats = SearchStats() if statistics else None
+        (value, move), context, transposition_table, time_to_depth = search(board, depth, size_mb, stats,
+                                                                            evaluator, pvs, aspiration, selective)
+        seconds = time_to_depth[-1]
+        result = {'position': name, 'depth': depth, 'value': value, 'move': repr(move), 'nodes': context.nodes,
+                  'quiescence_nodes': context.quiescence_nodes,
+                  'seconds': seconds, 'nps': context.nodes / seconds if seconds else 0.0,
+                  'time_to_depth': time_to_depth, 'tt_hit_rate': transposition_table.get_stats()['hit_rate'],
+                  'first_move_cutoff_rate': context.ordering.first_move_cutoff_rate}
+        if stats is not None:
+            result['stats'] = stats.get_stats()
+        del transposition_table
+
+        # tracing slows the search down, so the peak is measured on a second, identical run
+        if memory:
+            tracemalloc.start()
+            search(board, depth, size_mb, evaluator=evaluator, pvs=pvs, aspiration=aspiration, selective=selective)
+            result['peak_memory_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+            tracemalloc.stop()
+        results.append(result)
+    return results
+
+
+def random_positions(count, seed=0):
+    """Returns positions reached by random games from the start position"""
+    generator = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = BitBoard.from_fen(PERFT_POSITIONS[0][1])
+        while len(positions) < count:
+            moves = board.generate_moves(board.turn)
+            if not moves:
+                break
+            board.play(*generator.choice(moves))
+            positions.append(BitBoard(board.black, board.white, board.kings, board.turn))
+    return positions
+
+
+def run_evaluation(count, batch_size=8):
+    """Compares the throughput of scoring positions one by one with scoring them in batches of batch_size (about
+    the number of children of a node) and all at once"""
+    positions = random_positions(count)
+    evaluator = Evaluator()
+    black = [board.black for board in positions]
+    white = [board.white for board in positions]
+    kings = [board.kings for board in positions]
+
+    def batches():
+        for start in range(0, count, batch_size):
+            evaluator.evaluate_batch(black[start:start + batch_size], white[start:start + batch_size],
+                                     kings[start:start + batch_size])
+
+    results = []
+    for name, run in (('material', lambda: [evaluation_function(board) for board in positions]),
+                      ('scalar', lambda: [evaluator.evaluate(board) for board in positions]),
+                      (f'batch-{batch_size}', batches),
+                      ('batch-all', lambda: evaluator.evaluate_batch(black, white, kings))):
+        started = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - started
+        results.append({'evaluator': name, 'positions': count, 'seconds': seconds,
+                        'positions_per_second': count / seconds if seconds else 0.0})
+    return results
+
+
+def run_representation(count):
+    """Measures the memory taken by the Board of a position and its pieces, and how fast a move is played and
+    taken back on it"""
+    positions = random_positions(count, seed=1)
+    boards = [board.to_board() for board in positions]
+
+    tracemalloc.start()
+    copies = [deepcopy(board) for board in boards]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del copies
+
+    moves = []
+    for position, board in zip(positions, boards):
+        for piece, (move, skip) in board.get_all_valid_moves(position.turn):
+            moves.append((board, piece, move, skip))
+    started = time.perf_counter()
+    for board, piece, move, skip in moves:
+        board.unmake_move(board.make_move(piece, move, skip))
+    seconds = time.perf_counter() - started
+
+    piece = boards[0].get_pieces(positions[0].turn)[0]
+    piece_bytes = sys.getsizeof(piece) + (sys.getsizeof(piece.__dict__) if hasattr(piece, '__dict__') else 0)
+    return {'positions': count, 'bytes_per_position': size / count, 'bytes_per_piece': piece_bytes,
+            'moves': len(moves), 'seconds': seconds, 'moves_per_second': len(moves) / seconds if seconds else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless benchmark of the move generator (perft) and the search. '
+                                                 'Prints the report as JSON.')
+    parser.add_argument('--perft-depth', type=int, default=5, help='deepest perft depth to count')
+    parser.add_argument('--search-depth', type=int, default=8, help='depth of the timed searches')
+    parser.add_argument('--tt-size', type=int, default=16, help='transposition table size in megabytes')
+    parser.add_argument('--no-memory', action='store_true', help='skip the peak memory measurement')
+    parser.add_argument('--evaluation-positions', type=int, default=20000,
+                        help='number of positions scored by the evaluation benchmark')
+    parser.add_argument('--representation-positions', type=int, default=2000,
+                        help='number of positions of the board representation benchmark')
+    parser.add_argument('--evaluator', action='store_true',
+                        help='search with the feature evaluator of negamax.evaluation instead of material only')
+    parser.add_argument('--no-pvs', action='store_true',
+                        help='search every move with the full window instead of principal variation search')
+    parser.add_argument('--no-aspiration', action='store_true',
+                        help='start every iteration with the full window instead of an aspiration window')
+    parser.add_argument('--no-lmr', action='store_true', help='search every move to full depth')
+    parser.add_argument('--no-futility', action='store_true', help='search the quiet moves near the leaves as well')
+    parser.add_argument('--no-razoring', action='store_true',
+                        help='do not cut short the positions far below alpha near the leaves')
+    parser.add_argument('--stats', action='store_true',
+                        help='add the search statistics (cutoffs, table probes, branching factor) to the report')
+    parser.add_argument('--output', help='write the report to this file instead of stdout')
+    args = parser.parse_args()
+
+    report = {'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+              'platform': platform.platform(),
+              'perft': run_perft(args.perft_depth),
+              'evaluation': run_evaluation(args.evaluation_positions),
+              'representation': run_representation(args.representation_positions),
+              'search': run_search(args.search_depth, args.tt_size, not args.no_memory, args.stats,
+                                   Evaluator() if args.evaluator else None, not args.no_pvs,
+                                   None if args.no_aspiration else ASPIRATION_WINDOW,
+                                   {'lmr': not args.no_lmr, 'futility': not args.no_futility,
+                                    'razoring': not args.no_razoring})}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text)
+    else:
+        print(text)
+
+    # a wrong perft count means the move generator is broken
+    if not all(result['ok'] for result in report['perft']):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
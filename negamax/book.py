@@ -0,0 +1,185 @@
+import argparse
+import mmap
+import os
+import random
+import struct
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from os.path import exists
+
+from checkers.bitboard import BitBoard, square
+from checkers.board import Board
+from checkers.constants import BLACK, MAX_PLIES, OPENING_BOOK_FILENAME, WHITE
+from checkers.history import PositionHistory
+from negamax.evaluation import Evaluator
+from negamax.search import iterative_deepening
+from negamax.transposition_table import TranspositionTable, pack_move, unpack_move
+
+# File format: a header, then the keys, moves, game counts and scores of all entries as packed arrays. The
+# entries are sorted by key, so the entries of a position are found by binary search.
+MAGIC = b'CKOB'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHQ')  # magic, version, number of entries
+HEADER_SIZE = 16
+FIELDS = (('keys', 'Q'), ('moves', 'H'), ('counts', 'I'), ('scores', 'I'))
+
+
+def _self_play(seed, depth, plies, randomness):
+    """Plays one game of the engine against itself. Returns the (key, packed move, side) of its first plies moves
+    and the winner, None for a draw."""
+    generator = random.Random(seed)
+    board = BitBoard.from_board(Board())
+    transposition_table = TranspositionTable(1)
+    evaluator = Evaluator()
+    history = PositionHistory(board.key)
+    color = BLACK
+    played = []
+    for ply in range(MAX_PLIES):
+        if board.winner is not None:
+            return played, board.winner
+        moves = board.get_all_valid_moves(color)
+        if not moves:
+            return played, WHITE if color == BLACK else BLACK
+        if history.is_draw:
+            return played, None
+
+        # some moves of the opening are random, so the games spread over many lines
+        if ply < plies and generator.random() < randomness:
+            piece, (move, skip) = generator.choice(moves)
+            best = piece, move, skip
+        else:
+            best = iterative_deepening(board, color, transposition_table, max_depth=depth, evaluator=evaluator,
+                                       history=history.keys)[1]
+        if ply < plies:
+            played.append((board.key, pack_move(best), color))
+        piece, _, skip = best
+        irreversible = bool(skip) or not piece.king
+        board.make_move(*best)
+        history.push(board.key, irreversible)
+        color = WHITE if color == BLACK else BLACK
+    return played, None
+
+
+class OpeningBook:
+    """This class holds the opening book: for positions of the opening, the moves played in self-play games with
+    how many games they were played in and the points they scored (2 for a win, 1 for a draw).
+
+    The book is built with build (or python -m negamax.book) and saved with to_file; from_file maps the file
+    into memory.
+    """
+
+    def __init__(self):
+        for name, code in FIELDS:
+            setattr(self, name, array(code))
+
+    @classmethod
+    def build(cls, games, depth=6, plies=12, randomness=0.25, workers=None, seed=0):
+        """Method to build the book from games self-play games searched to depth; the moves of the first plies
+        plies are recorded, each of them is random with probability randomness"""
+        statistics = {}
+        with ProcessPoolExecutor(workers or os.cpu_count()) as pool:
+            seeds = range(seed, seed + games)
+            for played, winner in pool.map(_self_play, seeds, [depth] * games, [plies] * games,
+                                           [randomness] * games):
+                for key, move, color in played:
+                    entry = statistics.setdefault((key, move), [0, 0])
+                    entry[0] += 1
+                    entry[1] += 1 if winner is None else 2 * (winner == color)
+
+        book = cls()
+        for (key, move), (count, score) in sorted(statistics.items()):
+            book.keys.append(key)
+            book.moves.append(move)
+            book.counts.append(count)
+            book.scores.append(score)
+        return book
+
+    def __len__(self):
+        return len(self.keys)
+
+    def entries(self, key):
+        """Method to return the (packed move, games, points) of all moves of the position with the key"""
+        start = bisect_left(self.keys, key)
+        end = bisect_right(self.keys, key, start)
+        return [(self.moves[index], self.counts[index], self.scores[index]) for index in range(start, end)]
+
+    def choose(self, board, color, weighted=False, generator=random):
+        """Method to return a book move (piece, destination, skipped pieces) of the side, None if the position is
+        not in the book.
+
+        The move that scored best is chosen; weighted picks a move at random, in proportion to how often it was
+        played, so the opening varies from game to game.
+        """
+        key = board.key if isinstance(board, BitBoard) else BitBoard.from_board(board, color).key
+        entries = self.entries(key)
+        legal = {}
+        for piece, (move, skip) in board.get_all_valid_moves(color):
+            legal[square(piece.row, piece.col), square(*move)] = piece, move, skip
+        entries = [entry for entry in entries if unpack_move(entry[0]) in legal]
+        if not entries:
+            return None
+
+        if weighted:
+            code = generator.choices([code for code, _, _ in entries], [count for _, count, _ in entries])[0]
+        else:
+            code = max(entries, key=lambda entry: (entry[2] / entry[1], entry[1]))[0]
+        return legal[unpack_move(code)]
+
+    def to_file(self, name=OPENING_BOOK_FILENAME):
+        """Method to save the book to binary file"""
+        temporary = name + '.tmp'
+        with open(temporary, 'wb') as a_file:
+            a_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(self)).ljust(HEADER_SIZE, b'\0'))
+            for field, code in FIELDS:
+                a_file.write(array(code, getattr(self, field)).tobytes())
+            a_file.flush()
+            os.fsync(a_file.fileno())
+        os.replace(temporary, name)
+
+    def from_file(self, name=OPENING_BOOK_FILENAME):
+        """Method to map the book from binary file, returns False if the file is missing or incompatible"""
+        if not exists(name):
+            return False
+        with open(name, 'rb') as a_file:
+            header = a_file.read(HEADER_SIZE)
+            if len(header) < HEADER_SIZE:
+                return False
+            magic, version, count = HEADER.unpack_from(header)
+            size = sum(array(code).itemsize for _, code in FIELDS) * count
+            if (magic, version) != (MAGIC, FORMAT_VERSION):
+                return False
+            if os.fstat(a_file.fileno()).st_size != HEADER_SIZE + size:
+                return False
+            mapped = mmap.mmap(a_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(mapped)
+        offset = HEADER_SIZE
+        for field, code in FIELDS:
+            itemsize = array(code).itemsize
+            setattr(self, field, view[offset:offset + count * itemsize].cast(code))
+            offset += count * itemsize
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Builds the opening book from self-play games.')
+    parser.add_argument('--games', type=int, default=200, help='number of self-play games')
+    parser.add_argument('--depth', type=int, default=6, help='search depth of the self-play moves')
+    parser.add_argument('--plies', type=int, default=12, help='number of opening plies recorded per game')
+    parser.add_argument('--randomness', type=float, default=0.25,
+                        help='probability that a recorded move is played at random')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes')
+    parser.add_argument('--output', default=OPENING_BOOK_FILENAME, help='file to write the book to')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    book = OpeningBook.build(args.games, args.depth, args.plies, args.randomness, args.workers)
+    book.to_file(args.output)
+    print(f'{len(book)} entries from {args.games} games written to {args.output} in '
+          f'{time.perf_counter() - started:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
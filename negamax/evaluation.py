@@ -0,0 +1,146 @@
+import json
+import os
+
+import numpy as np
+
+from checkers.bitboard import BitBoard, DOWN, FULL, SQUARES, SQUARE_TO_ROW_COL, STEP_SHIFTS, UP, iter_bits, shift_back
+
+WEIGHTS_FILENAME = os.path.join(os.path.dirname(__file__), 'weights.json')
+WEIGHT_NAMES = ('man', 'king', 'man_squares', 'king_squares', 'back_rank', 'tempo', 'mobility', 'runaway')
+
+_SHIFTS = np.arange(SQUARES, dtype=np.uint64)
+
+
+def _cone(sq):
+    """Returns the mask of the squares in front of a black man on the square, up to the king row"""
+    row, col = SQUARE_TO_ROW_COL[sq]
+    cone = 0
+    for ahead in range(row):
+        for other in range(ahead * 4, ahead * 4 + 4):
+            if abs(SQUARE_TO_ROW_COL[other][1] - col) <= row - ahead:
+                cone |= 1 << other
+    return cone
+
+
+# squares a man must be able to pass to reach the king row; the board turned around gives the cones of white
+BLACK_CONES = np.array([_cone(sq) for sq in range(SQUARES)], dtype=np.uint64)
+WHITE_CONES = np.array([int(f'{_cone(SQUARES - 1 - sq):032b}'[::-1], 2) for sq in range(SQUARES)], dtype=np.uint64)
+
+
+def load_weights(name=WEIGHTS_FILENAME):
+    """Reads the evaluation weights from a JSON file, raises ValueError if one is missing or malformed"""
+    with open(name) as a_file:
+        weights = json.load(a_file)
+    missing = [key for key in WEIGHT_NAMES if key not in weights]
+    if missing:
+        raise ValueError(f'{name}: missing weights {", ".join(missing)}')
+    for key in ('man_squares', 'king_squares'):
+        if len(weights[key]) != SQUARES:
+            raise ValueError(f'{name}: {key} must have {SQUARES} values')
+    return weights
+
+
+def _bits(masks):
+    """Returns the bits of the masks as an array of shape (len(masks), 32)"""
+    return (masks[:, None] >> _SHIFTS) & 1
+
+
+def _mobility(own, kings, empty, forward, backward):
+    """Counts the quiet moves of one side in every position"""
+    # the counts are subtracted later, so they are summed as signed ints
+    count = np.zeros(len(own), dtype=np.int64)
+    for direction in forward:
+        count += _bits(own & shift_back(empty, direction, STEP_SHIFTS[direction])).sum(axis=1, dtype=np.int64)
+    for direction in backward:
+        count += _bits(own & kings & shift_back(empty, direction, STEP_SHIFTS[direction])).sum(axis=1, dtype=np.int64)
+    return count
+
+
+def _side_mobility(own, kings, empty, forward, backward):
+    """Counts the quiet moves of one side in one position, with Python ints"""
+    count = 0
+    for direction in forward:
+        count += (own & shift_back(empty, direction, STEP_SHIFTS[direction])).bit_count()
+    for direction in backward:
+        count += (own & kings & shift_back(empty, direction, STEP_SHIFTS[direction])).bit_count()
+    return count
+
+
+class Evaluator:
+    """This class scores positions with a linear combination of features, from white's point of view like
+    negamax.evaluation_function.
+
+    The features are material, piece-square tables, men guarding the back rank, tempo (how far the men have
+    advanced), mobility and runaway men (men no opponent piece can stop on their way to the king row).
+    The search scores one position at a time in plain Python. evaluate_batch scores a whole set of positions
+    with NumPy, about three times faster per position, but a node has too few children for a batch of them to pay
+    off. Tables are given as seen by black, square 0 on row 0; white uses them turned around.
+    """
+
+    def __init__(self, weights=None):
+        """weights is a dict as in weights.json, or the name of such a file (default: negamax/weights.json)"""
+        if weights is None or isinstance(weights, str):
+            weights = load_weights(*(() if weights is None else (weights,)))
+        self.weights = weights
+
+        # material, piece-square values, back rank and tempo depend only on the square of each piece, so they
+        # are folded into one value per piece type and square
+        rows = np.array([row for row, _ in SQUARE_TO_ROW_COL], dtype=float)
+        man = (weights['man'] + np.array(weights['man_squares'], dtype=float) + weights['tempo'] * (7 - rows)
+               + weights['back_rank'] * (rows == 7))
+        king = weights['king'] + np.array(weights['king_squares'], dtype=float)
+        # black men, black kings, white men, white kings
+        self.table = np.concatenate((-man, -king, man[::-1], king[::-1]))
+
+        # the same as Python lists for evaluate
+        self.values = self.table.tolist()
+        self.black_cones, self.white_cones = BLACK_CONES.tolist(), WHITE_CONES.tolist()
+
+    def evaluate_batch(self, black, white, kings):
+        """Method to return the scores of the positions given by their black, white and king masks"""
+        black = np.asarray(black, dtype=np.uint64)
+        white = np.asarray(white, dtype=np.uint64)
+        kings = np.asarray(kings, dtype=np.uint64)
+        men = ~kings
+
+        # one row of bits per position: black men, black kings, white men, white kings
+        pieces = _bits(np.stack((black & men, black & kings, white & men, white & kings), axis=1).ravel())
+        pieces = pieces.reshape(len(black), 4 * SQUARES)
+        scores = pieces @ self.table
+
+        empty = ~(black | white) & np.uint64(FULL)
+        mobility = _mobility(white, kings, empty, DOWN, UP) - _mobility(black, kings, empty, UP, DOWN)
+
+        # a man runs away when no opponent piece stands in its cone
+        black_runaways = ((white[:, None] & BLACK_CONES) == 0) * pieces[:, :SQUARES]
+        white_runaways = ((black[:, None] & WHITE_CONES) == 0) * pieces[:, 2 * SQUARES:3 * SQUARES]
+        runaways = white_runaways.sum(axis=1).astype(np.int64) - black_runaways.sum(axis=1).astype(np.int64)
+
+        return scores + self.weights['mobility'] * mobility + self.weights['runaway'] * runaways
+
+    def evaluate(self, board):
+        """Method to return the score of one board (a BitBoard or a checkers.board.Board)"""
+        if not isinstance(board, BitBoard):
+            board = BitBoard.from_board(board)
+        return self._score(board.black, board.white, board.kings)
+
+    def _score(self, black, white, kings):
+        """Method to return the score of one position in plain Python, the same as evaluate_batch"""
+        values = self.values
+
+        score, runaways = 0.0, 0
+        for sq in iter_bits(black & ~kings):
+            score += values[sq]
+            runaways -= not white & self.black_cones[sq]
+        for sq in iter_bits(black & kings):
+            score += values[SQUARES + sq]
+        for sq in iter_bits(white & ~kings):
+            score += values[2 * SQUARES + sq]
+            runaways += not black & self.white_cones[sq]
+        for sq in iter_bits(white & kings):
+            score += values[3 * SQUARES + sq]
+
+        empty = ~(black | white) & FULL
+        mobility = (_side_mobility(white, kings, empty, DOWN, UP)
+                    - _side_mobility(black, kings, empty, UP, DOWN))
+        return score + self.weights['mobility'] * mobility + self.weights['runaway'] * runaways
@@ -0,0 +1,170 @@
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from checkers.bitboard import BitBoard, square
+from checkers.board import Board
+from checkers.constants import BLACK, MAX_PLIES, WHITE
+from checkers.history import PositionHistory
+from negamax.evaluation import Evaluator
+from negamax.negamax import QUIESCENCE_DEPTH
+from negamax.ordering import MoveOrdering
+from negamax.search import ASPIRATION_WINDOW, iterative_deepening
+from negamax.transposition_table import TranspositionTable
+
+# settings of an engine and their defaults; weights is a weights file of negamax.evaluation, or 'material' for
+# negamax.evaluation_function, quiescence the longest capture sequence followed past depth (0 for none), pvs
+# the principal variation search, aspiration the half width of the aspiration windows (None for none), and lmr,
+# futility and razoring the selective search
+DEFAULT_ENGINE = {'depth': 6, 'time': None, 'nodes': None, 'weights': None, 'tt_size': 4,
+                  'quiescence': QUIESCENCE_DEPTH, 'pvs': True, 'aspiration': ASPIRATION_WINDOW,
+                  'lmr': True, 'futility': True, 'razoring': True}
+
+# z of the two-sided 95% confidence interval
+Z_95 = 1.959964
+
+
+def engine_config(text):
+    """Parses the JSON settings of an engine, e.g. '{"depth": 4, "weights": "weights.json"}'"""
+    config = json.loads(text)
+    unknown = set(config) - set(DEFAULT_ENGINE)
+    if unknown:
+        raise ValueError(f'unknown engine settings: {", ".join(sorted(unknown))}')
+    return {**DEFAULT_ENGINE, **config}
+
+
+def notation(start, end, captured):
+    """Returns the move in draughts notation: squares 1 to 32, '-' for a move and 'x' for a capture"""
+    return f"{start + 1}{'x' if captured else '-'}{end + 1}"
+
+
+class Engine:
+    """One side of a match: its settings with the tables it keeps from move to move"""
+
+    def __init__(self, config):
+        self.config = config
+        self.transposition_table = TranspositionTable(config['tt_size'])
+        self.ordering = MoveOrdering()
+        self.evaluator = None if config['weights'] == 'material' else Evaluator(config['weights'])
+
+    def search(self, board, color, history=()):
+        return iterative_deepening(board, color, self.transposition_table, time_limit=self.config['time'],
+                                   node_limit=self.config['nodes'], max_depth=self.config['depth'],
+                                   ordering=self.ordering, evaluator=self.evaluator,
+                                   quiescence_depth=self.config['quiescence'], pvs=self.config['pvs'],
+                                   aspiration=self.config['aspiration'], history=history, lmr=self.config['lmr'],
+                                   futility=self.config['futility'], razoring=self.config['razoring'])[1]
+
+
+def play_game(game, seed, configs, random_plies):
+    """Plays one game of a match. The opening is random_plies random moves chosen with the seed; the engines
+    swap colours from game to game, so both play every opening with both colours. Returns the record of the
+    game; the winner is 'a', 'b' or None for a draw."""
+    generator = random.Random(seed)
+    engines = {name: Engine(config) for name, config in configs.items()}
+    players = {BLACK: 'a', WHITE: 'b'} if game % 2 == 0 else {BLACK: 'b', WHITE: 'a'}
+
+    board = BitBoard.from_board(Board())
+    history = PositionHistory(board.key)
+    color, winner, moves = BLACK, None, []
+    started = time.perf_counter()
+    for ply in range(MAX_PLIES):
+        legal = board.generate_moves(color)
+        if not legal:
+            winner = players[WHITE if color == BLACK else BLACK]
+            break
+        if history.is_draw:
+            break
+        if ply < random_plies:
+            start, end, captured = generator.choice(legal)
+        else:
+            piece, destination, skip = engines[players[color]].search(board, color, history.keys)
+            start, end = square(piece.row, piece.col), square(*destination)
+            captured = sum(1 << square(skipped.row, skipped.col) for skipped in skip)
+        moves.append(notation(start, end, captured))
+        irreversible = captured or not board.kings >> start & 1
+        board.play(start, end, captured)
+        history.push(board.key, irreversible)
+        color = WHITE if color == BLACK else BLACK
+
+    result = {None: '1/2-1/2', players[BLACK]: '1-0', players[WHITE]: '0-1'}[winner]
+    return {'game': game, 'seed': seed, 'black': players[BLACK], 'white': players[WHITE], 'winner': winner,
+            'result': result, 'plies': len(moves), 'seconds': time.perf_counter() - started, 'moves': moves}
+
+
+def pdn(record, configs):
+    """Returns the game in Portable Draughts Notation"""
+    moves = []
+    for number, ply in enumerate(range(0, len(record['moves']), 2), 1):
+        moves.append(f'{number}. ' + ' '.join(record['moves'][ply:ply + 2]))
+    tags = [('Event', 'Engine match'), ('Round', record['game'] + 1),
+            ('Black', json.dumps(configs[record['black']])), ('White', json.dumps(configs[record['white']])),
+            ('Seed', record['seed']), ('Result', record['result'])]
+    return '\n'.join(f'[{tag} {json.dumps(str(value))}]' for tag, value in tags) + '\n' + \
+        ' '.join(moves + [record['result']]) + '\n'
+
+
+def elo(score):
+    """Returns the Elo difference that corresponds to the expected score (0 to 1)"""
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def summary(wins, draws, losses):
+    """Returns the score of engine a with its Elo difference and 95% confidence interval"""
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games if games else 0.5
+    # standard error of the mean score of one game
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games if games else 0
+    error = math.sqrt(variance / games) if games else 0
+    return {'games': games, 'wins': wins, 'draws': draws, 'losses': losses, 'score': score,
+            'elo': elo(score), 'elo_low': elo(score - Z_95 * error), 'elo_high': elo(score + Z_95 * error)}
+
+
+def run_match(configs, games, random_plies=4, seed=0, workers=None, output=sys.stdout, pdn_format=False):
+    """Plays a match of games games between the engines configs['a'] and configs['b'] on a pool of processes.
+    Every game is written to output as soon as it ends, as a JSON line or in PDN. Returns the summary from the
+    point of view of engine a."""
+    results = {'a': 0, None: 0, 'b': 0}
+    with ProcessPoolExecutor(workers or os.cpu_count()) as pool:
+        # the two games of a pair share their seed, so both engines play the opening with both colours
+        futures = [pool.submit(play_game, game, seed + game // 2, configs, random_plies) for game in range(games)]
+        for future in as_completed(futures):
+            record = future.result()
+            results[record['winner']] += 1
+            output.write(pdn(record, configs) + '\n' if pdn_format else json.dumps(record) + '\n')
+            output.flush()
+    return summary(results['a'], results[None], results['b'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plays a match between two engine configurations without a window '
+                                                 'and reports the result of engine a with its Elo difference.')
+    parser.add_argument('--engine-a', type=engine_config, default='{}',
+                        help=f'JSON settings of engine a, keys: {", ".join(DEFAULT_ENGINE)}')
+    parser.add_argument('--engine-b', type=engine_config, default='{}', help='JSON settings of engine b')
+    parser.add_argument('--games', type=int, default=100, help='number of games, best even')
+    parser.add_argument('--random-plies', type=int, default=4, help='random moves at the start of every game')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game pair')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes')
+    parser.add_argument('--pdn', action='store_true', help='write the games in PDN instead of JSON lines')
+    parser.add_argument('--output', help='write the games to this file instead of stdout')
+    args = parser.parse_args()
+
+    configs = {'a': args.engine_a, 'b': args.engine_b}
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        result = run_match(configs, args.games, args.random_plies, args.seed, args.workers, output, args.pdn)
+    finally:
+        if args.output:
+            output.close()
+    print(json.dumps(result), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,66 +1,224 @@
-import pygame
-from copy import deepcopy
-from checkers.constants import WHITE, BLACK
-from enum import Enum
+from checkers.constants import WHITE, BLACK, ROWS
+from checkers.bitboard import square
+from negamax.transposition_table import Flag, pack_move, unpack_move
 
+# longest capture sequence the quiescence search follows past the nominal depth, in plies
+QUIESCENCE_DEPTH = 8
 
-# Flags for the transposition table records
-class Flag(Enum):
-    EXACT = 'exact'
-    LOWERBOUND = 'lowerbound'
-    UPPERBOUND = 'upperbound'
+# width of the null window of the principal variation search; the scores are floats, far coarser than this
+NULL_WINDOW = 1e-4
+
+# value of a drawn position: a position that comes back is scored as a draw
+DRAW_VALUE = 0
+
+# late move reductions: from this depth on, the quiet moves after the first LMR_MOVES are searched one ply less
+# deep, those after the first LMR_LATE two plies less
+LMR_DEPTH = 3
+LMR_MOVES = 2
+LMR_LATE = 5
+
+# margins of the futility pruning and the razoring by remaining depth (index 0 is unused), in men; at depths past
+# the end of a tuple the pruning is off. They are added to the material balance, which is cheap to count, so they
+# also cover what the positional terms of an Evaluator may add.
+FUTILITY_MARGINS = (0, 0.8, 1.5)
+RAZOR_MARGINS = (0, 1.2, 2.0)
 
 
 # negamax algorithm with alpha-beta pruning and transposition table
-def negamax(board, depth, color, color_num, game, alpha, beta, transposition_table):
-    """This function is used to return the optimal next move and the value of eval function for this move"""
+def negamax(board, depth, color, color_num, alpha, beta, transposition_table, ply=0, context=None, pv_node=True):
+    """This function is used to return the value of eval function and the optimal move for this position.
+
+    The move is (piece, destination, skipped pieces); the board is left as it was given. The optional context
+    (see negamax.search) holds the budget of the search and the features it runs with. pv_node is False for the
+    nodes off the principal variation, the only ones that may be pruned.
+    """
+    stats = evaluator = pv_table = history = None
+    pvs = lmr = False
+    if context is not None:
+        context.visit()
+        stats, evaluator, pvs, pv_table = context.stats, context.evaluator, context.pvs, context.pv_table
+        lmr = context.lmr and depth >= LMR_DEPTH
+        pv_table[ply] = []
+
+        history = context.history
+        if ply > 0 and context.is_draw(board.key):
+            if stats is not None:
+                stats.repetition()
+            return DRAW_VALUE, None
+        if stats is not None:
+            stats.node(ply)
+
+        # a solved endgame is not searched: the tablebase gives its exact value with the distance to the end of
+        # the game, but no move, so it is not probed at the root
+        if ply > 0 and context.tablebase is not None:
+            score = context.tablebase.score(board, color)
+            if score is not None:
+                return score, None
 
     # save original alpha value
     alpha_original = alpha
 
     # lookup for the board in the transposition table. If it is there, it can speed up the process hugely.
-    lookup = transposition_table.get_entry(board.board)
-    if lookup is not None and lookup.depth >= depth:
+    # The root has to search its moves anyway, because it must return one of them.
+    lookup = transposition_table.get_entry(board.key)
+    if stats is not None:
+        stats.probe(lookup)
+    if ply > 0 and lookup is not None and lookup.depth >= depth:
         if lookup.flag == Flag.EXACT:
-            return lookup.value, board
+            return lookup.value, None
         elif lookup.flag == Flag.LOWERBOUND:
             alpha = max(alpha, lookup.value)
         elif lookup.flag == Flag.UPPERBOUND:
             beta = min(beta, lookup.value)
 
         if alpha >= beta:
-            return lookup.value, board
+            return lookup.value, None
+
+    # base case for the recursion, if the game is over or we reached up the max depth of search; the captures
+    # that are pending at that depth are still played out
+    if board.winner is not None:
+        return color_num * evaluate(board, evaluator), None
+    if depth == 0:
+        return quiescence(board, color, color_num, alpha, beta, ply, context), None
 
-    # base case for the recursion, if we reached up the max depth of search or the game is over
-    if depth == 0 or board.winner is not None:
-        return color_num * evaluation_function(board), board
+    # the principal variation is searched in full, the rest only has to be proven worse than alpha: near the
+    # leaves, a node whose static evaluation is far below alpha is cut short. Razoring only plays out the captures,
+    # futility pruning skips the quiet moves after the first.
+    futility_value = None
+    if context is not None and ply > 0 and not pv_node:
+        razoring = context.razoring and depth < len(RAZOR_MARGINS)
+        futility = context.futility and depth < len(FUTILITY_MARGINS)
+        if razoring or futility:
+            static = color_num * evaluation_function(board)
+            if razoring and static + RAZOR_MARGINS[depth] <= alpha:
+                razor_value = quiescence(board, color, color_num, alpha, beta, ply, context)
+                if razor_value <= alpha:
+                    if stats is not None:
+                        stats.prune('razoring')
+                    return razor_value, None
+            if futility and static + FUTILITY_MARGINS[depth] <= alpha:
+                futility_value = static + FUTILITY_MARGINS[depth]
 
-    value, next_board = float('-inf'), None
+    value, best_move = float('-inf'), None
+    opponent_color = BLACK if color == WHITE else WHITE
+
+    moves = board.get_all_valid_moves(color)
+    if stats is not None:
+        stats.expand(len(moves))
+
+    # the best move found for this position by an earlier (shallower) search is tried first
+    tt_move = lookup.move if lookup is not None else 0
+    if context is not None:
+        moves = context.ordering.order(moves, tt_move, ply, color)
+    elif tt_move:
+        # the move list is shared with the move cache of the board, it is reordered on a copy
+        moves = list(moves)
+        tt_move_first(moves, tt_move)
+
+    # the children are leaves: they are scored right after the move instead of one negamax call each, only the
+    # children where the opponent has to capture go on to quiescence
+    leaves = depth == 1 and evaluator is not None
+
+    # the position is on the line until its moves are searched; the root stays in the history, it is where the
+    # game is
+    if history is not None:
+        history.add(board.key)
+        quiet_plies = context.quiet_plies
 
     # recursion through the nodes in the search tree
-    for piece in board.get_pieces(color):
-        for move, skip in board.get_valid_moves(piece).items():
-            # uncomment next line to see how algorithm checks moves to find the optimal one
-            # draw_moves(game, board, piece)
+    for index, (piece, (move, skip)) in enumerate(moves):
+        child_line = ()
+        # a quiet move neither captures nor crowns a man
+        quiet = not skip and (piece.king or 0 < move[0] < ROWS - 1)
+        if history is not None:
+            # a capture or a man move starts the count of the draw by no progress again
+            context.quiet_plies = quiet_plies + 1 if piece.king and not skip else 0
+
+        # not even a man more would lift the position to alpha, and a quiet move does not win one
+        if futility_value is not None and index > 0 and quiet:
+            if stats is not None:
+                stats.prune('futility')
+            value = max(value, futility_value)
+            continue
+
+        if leaves:
+            undo = board.make_move(piece, move, skip)
+            if context.is_draw(board.key):
+                if stats is not None:
+                    stats.repetition()
+                new_value = DRAW_VALUE
+            elif board.winner is None and board.has_captures(opponent_color):
+                new_value = -1 * quiescence(board, opponent_color, -1 * color_num, -1 * beta, -1 * alpha,
+                                            ply + 1, context)
+            else:
+                context.visit()
+                if stats is not None:
+                    stats.node(ply + 1)
+                new_value = color_num * evaluator.evaluate(board)
+            board.unmake_move(undo)
+        else:
+            # play the move on the board, it is taken back after the subtree is searched
+            undo = board.make_move(piece, move, skip)
 
-            # simulate the move
-            simulated_board = simulate_move(board, piece, move, skip)
-            opponent_color = BLACK if color == WHITE else WHITE
+            # calculate the value of eval function for the new board after the move. With the principal variation
+            # search only the first move gets the full window, the others are tested with a null window to be worse;
+            # the late quiet moves are searched less deep, and again at full depth if they turn out better than alpha
+            reduction = 0
+            if lmr and quiet and index >= LMR_MOVES:
+                reduction = 2 if index >= LMR_LATE and depth > LMR_DEPTH else 1
+                if stats is not None:
+                    stats.reduction(reduction)
+            if index == 0 or not (pvs or reduction):
+                new_value = -1 * negamax(board, depth - 1, opponent_color, -1 * color_num,
+                                         -1 * beta, -1 * alpha, transposition_table, ply + 1, context,
+                                         pv_node and index == 0)[0]
+            else:
+                # without the principal variation search a reduced move is tested with the full window
+                window = -1 * alpha - NULL_WINDOW if pvs else -1 * beta
+                new_value = -1 * negamax(board, depth - 1 - reduction, opponent_color, -1 * color_num,
+                                         window, -1 * alpha, transposition_table, ply + 1, context, False)[0]
+                if reduction and new_value > alpha:
+                    if stats is not None:
+                        stats.research('lmr')
+                    new_value = -1 * negamax(board, depth - 1, opponent_color, -1 * color_num,
+                                             window, -1 * alpha, transposition_table, ply + 1, context, False)[0]
+                # the move may be better than the principal variation so far, it takes its place
+                if pvs and alpha < new_value < beta:
+                    if stats is not None:
+                        stats.research('pvs')
+                    new_value = -1 * negamax(board, depth - 1, opponent_color, -1 * color_num,
+                                             -1 * beta, -1 * alpha, transposition_table, ply + 1, context,
+                                             pv_node)[0]
+            if pv_table is not None:
+                child_line = pv_table[ply + 1]
 
-            # calculate the value of eval function for the new board after the move
-            new_value = -1 * negamax(simulated_board, depth - 1, opponent_color, -1 * color_num,
-                                     game, -1 * beta, -1 * alpha, transposition_table)[0]
+            board.unmake_move(undo)
 
-            # if the value is higher than all values we've seen before, store this value and the board after this move
-            if new_value > value:
-                value, next_board = new_value, simulated_board
+        # the move is the best one inside the window so far, the line of its child follows it. The lines are kept
+        # as packed moves, since the pieces of a Board move around during the search
+        if pv_table is not None and new_value > alpha:
+            pv_table[ply] = [pack_move((piece, move, skip)), *child_line]
 
-            # update alpha value if necessary
-            alpha = max(alpha, new_value)
+        # if the value is higher than all values we've seen before, store this value and the move. In a lost
+        # position every move is worth -inf, the first one is still returned so there is a move to play.
+        if new_value > value or best_move is None:
+            value, best_move = new_value, (piece, move, skip)
 
-            # if alpha is bigger than beta, cut off the tree
-            if alpha >= beta:
-                break
+        # update alpha value if necessary
+        alpha = max(alpha, new_value)
+
+        # if alpha is bigger than beta, cut off the tree
+        if alpha >= beta:
+            if context is not None:
+                context.ordering.cutoff(piece, move, skip, depth, ply, color, index)
+                if stats is not None:
+                    stats.cutoff(index)
+            break
+
+    if history is not None:
+        context.quiet_plies = quiet_plies
+        if ply > 0:
+            history.discard(board.key)
 
     # store the resulting board in the transposition table
     if value <= alpha_original:
@@ -69,19 +227,64 @@ def negamax(board, depth, color, color_num, game, alpha, beta, transposition_tab
         flag = Flag.LOWERBOUND
     else:
         flag = Flag.EXACT
-    transposition_table.add_entry(board.board, depth, value, flag)
+    transposition_table.add_entry(board.key, depth, value, flag, pack_move(best_move))
+    if stats is not None:
+        stats.store(flag)
+
+    return value, best_move
 
-    return value, next_board
 
+def quiescence(board, color, color_num, alpha, beta, ply=0, context=None, extension=0):
+    """This function returns the value of the position once the capture sequences are played out.
 
-def simulate_move(board, piece, move, skip):
-    """This function is used to simulate the move without affecting actual board nd pieces on it"""
-    board_copy = deepcopy(board)
-    piece_copy = board_copy.get_piece(piece.row, piece.col)
-    board_copy.move(piece_copy, *move)
-    if len(skip) > 0:
-        board_copy.remove(skip)
-    return board_copy
+    Captures are compulsory, so a side that can capture is not allowed to stand pat: all its captures are
+    searched with alpha-beta. A position where the side to move has no capture is quiet and is evaluated.
+    The sequence is cut after the quiescence depth of the context (QUIESCENCE_DEPTH without a context). The
+    nodes past the nominal depth (extension > 0) are also counted apart in the context and its SearchStats.
+    """
+    evaluator, limit = None, QUIESCENCE_DEPTH
+    if context is not None:
+        context.visit()
+        evaluator, limit, stats = context.evaluator, context.quiescence_depth, context.stats
+        if extension:
+            context.quiescence_nodes += 1
+            if stats is not None:
+                stats.quiescence_node(ply, extension)
+        elif stats is not None:
+            stats.node(ply)
+
+    if board.winner is not None or extension >= limit or not board.has_captures(color):
+        return color_num * evaluate(board, evaluator)
+
+    value = float('-inf')
+    opponent_color = BLACK if color == WHITE else WHITE
+    for piece, (move, skip) in board.get_all_valid_moves(color):
+        undo = board.make_move(piece, move, skip)
+        new_value = -1 * quiescence(board, opponent_color, -1 * color_num, -1 * beta, -1 * alpha, ply + 1,
+                                    context, extension + 1)
+        board.unmake_move(undo)
+
+        value = max(value, new_value)
+        alpha = max(alpha, new_value)
+        if alpha >= beta:
+            break
+    return value
+
+
+def tt_move_first(moves, code):
+    """This function moves the move packed in the transposition table to the front of the move list"""
+    start, end = unpack_move(code)
+    for index, (piece, (move, _)) in enumerate(moves):
+        if square(piece.row, piece.col) == start and square(*move) == end:
+            moves.insert(0, moves.pop(index))
+            return
+
+
+def evaluate(board, evaluator=None):
+    """This function scores the position with the evaluator, or with evaluation_function if there is none"""
+    if evaluator is not None:
+        return evaluator.evaluate(board)
+    return evaluation_function(board)
 
 
 def evaluation_function(board):
@@ -89,12 +292,3 @@ def evaluation_function(board):
     return (board.white_left - board.white_kings) + board.white_kings * 2 - (board.black_left -
                                                                              board.black_kings) - board.black_kings * 2
 
-
-def draw_moves(game, board, piece):
-    """This helper function shows the searching process of the negamax algorithm"""
-    valid_moves = board.get_valid_moves(piece)
-    board.draw(game.win)
-    pygame.draw.circle(game.win, (0, 255, 0), (piece.x, piece.y), 50, 5)
-    game.draw_valid_moves(valid_moves.keys())
-    pygame.display.update()
-    pygame.time.delay(1000)
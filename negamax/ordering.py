@@ -0,0 +1,84 @@
+from checkers.bitboard import square
+from checkers.constants import BLACK
+from negamax.transposition_table import unpack_move
+
+
+class MoveOrdering:
+    """This class sorts the moves of a node so that the ones most likely to cause a cutoff are searched first.
+
+    The order is: the best move stored in the transposition table, captures (the more pieces the earlier),
+    the killer moves of the ply (quiet moves that caused a cutoff in a sibling node), and then the other quiet
+    moves by their history score (how often and how deep they caused cutoffs anywhere in the tree).
+    Moves are identified by their start and end squares.
+    """
+
+    KILLERS_PER_PLY = 2
+
+    def __init__(self):
+        self.killers = []
+        self.history = [[0] * 1024 for _ in range(2)]
+
+        # how many nodes had a cutoff and how many of those were caused by the first move searched
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def new_search(self):
+        """Method to forget the killers and age the history scores before the next search"""
+        self.killers = []
+        for table in self.history:
+            for index, score in enumerate(table):
+                if score:
+                    table[index] = score // 2
+
+    @staticmethod
+    def move_key(piece, move):
+        """Method to return the start and end squares of the move packed into one int"""
+        return square(piece.row, piece.col) | square(*move) << 5
+
+    def order(self, moves, tt_move, ply, color):
+        """Method to return the moves (piece, (destination, skipped pieces)) in the order they should be searched"""
+        start_end = unpack_move(tt_move)
+        tt_key = start_end[0] | start_end[1] << 5 if start_end is not None else -1
+        killers = self.killers[ply] if ply < len(self.killers) else ()
+        history = self.history[color == BLACK]
+        move_key = self.move_key
+
+        def score(item):
+            piece, (move, skip) = item
+            key = move_key(piece, move)
+            if key == tt_key:
+                return 3, 0
+            if skip:
+                return 2, len(skip)
+            if key in killers:
+                return 1, -killers.index(key)
+            return 0, history[key]
+
+        return sorted(moves, key=score, reverse=True)
+
+    def cutoff(self, piece, move, skip, depth, ply, color, index):
+        """Method to record that the move caused a cutoff; index is its position in the searched order"""
+        self.cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+
+        # captures are already searched early, only quiet moves become killers and gain history
+        if skip:
+            return
+        key = self.move_key(piece, move)
+        while len(self.killers) <= ply:
+            self.killers.append([])
+        killers = self.killers[ply]
+        if key not in killers:
+            killers.insert(0, key)
+            del killers[self.KILLERS_PER_PLY:]
+        self.history[color == BLACK][key] += depth * depth
+
+    @property
+    def first_move_cutoff_rate(self):
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def get_stats(self):
+        """Method to return the cutoff counters"""
+        return {'cutoffs': self.cutoffs, 'first_move_cutoffs': self.first_move_cutoffs,
+                'first_move_cutoff_rate': self.first_move_cutoff_rate}
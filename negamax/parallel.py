@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+from checkers.bitboard import BitBoard
+from checkers.board import Board
+from checkers.constants import BLACK, TRANSPOSITION_TABLE_SIZE_MB
+from negamax.search import SearchContext, iterative_deepening
+from negamax.transposition_table import TranspositionTable
+
+
+def _report(result, context, seconds):
+    value, move, depth = result
+    return {'value': value, 'move': move, 'depth': depth, 'nodes': context.nodes, 'seconds': seconds,
+            'nps': context.nodes / seconds if seconds else 0.0}
+
+
+def _search_worker(memory_name, table_bytes, board, color, start_depth, max_depth, time_limit):
+    """One searcher of the Lazy SMP search, runs in a process of the pool"""
+    memory = SharedMemory(name=memory_name)
+    transposition_table = TranspositionTable(buffer=memory.buf[:table_bytes])
+    stop_flag = memory.buf[table_bytes:table_bytes + 1]
+    context = SearchContext(time_limit, stop=lambda: stop_flag[0] != 0)
+    started = time.perf_counter()
+    try:
+        result = iterative_deepening(board, color, transposition_table, max_depth=max_depth,
+                                     start_depth=start_depth, context=context)
+    finally:
+        transposition_table.release()
+        stop_flag.release()
+        memory.close()
+    return _report(result, context, time.perf_counter() - started)
+
+
+def parallel_search(board, color, depth, workers=None, time_limit=None, size_mb=TRANSPOSITION_TABLE_SIZE_MB):
+    """This function runs a Lazy SMP search: several processes search the same position and share one
+    transposition table in shared memory.
+
+    The first worker searches up to the given depth and its result is the result of the search; the helpers
+    start and end one ply deeper on every other worker, so they fill the table with results the first worker
+    reaches later. When the first worker is done the others are stopped. With one worker the search runs in
+    this process on a fresh table and is deterministic.
+    Returns a dict with value, move and depth, and nodes, seconds and nodes per second of every worker.
+    """
+    workers = workers or os.cpu_count()
+    started = time.perf_counter()
+    if workers == 1:
+        context = SearchContext(time_limit)
+        result = iterative_deepening(board, color, TranspositionTable(size_mb), max_depth=depth, context=context)
+        reports = [_report(result, context, time.perf_counter() - started)]
+    else:
+        table_bytes = TranspositionTable.buffer_size(size_mb)
+        # shared memory is zero-filled: an empty table and a cleared stop flag after it
+        memory = SharedMemory(create=True, size=table_bytes + 1)
+        try:
+            with ProcessPoolExecutor(workers) as pool:
+                first = pool.submit(_search_worker, memory.name, table_bytes, board, color, 1, depth, time_limit)
+                helpers = [pool.submit(_search_worker, memory.name, table_bytes, board, color,
+                                       1 + worker % 2, depth + worker % 2, time_limit)
+                           for worker in range(1, workers)]
+                reports = [first.result()]
+                memory.buf[table_bytes] = 1
+                reports += [helper.result() for helper in helpers]
+        finally:
+            memory.close()
+            memory.unlink()
+
+    seconds = time.perf_counter() - started
+    nodes = sum(report['nodes'] for report in reports)
+    return {'value': reports[0]['value'], 'move': reports[0]['move'], 'depth': reports[0]['depth'],
+            'nodes': nodes, 'seconds': seconds, 'nps': nodes / seconds if seconds else 0.0,
+            'workers': [{key: report[key] for key in ('depth', 'nodes', 'seconds', 'nps')} for report in reports]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs a parallel search from the starting position to check '
+                                                 'how the nodes per second scale with the number of workers.')
+    parser.add_argument('--depth', type=int, default=10)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count()])
+    args = parser.parse_args()
+
+    for workers in args.workers:
+        result = parallel_search(BitBoard.from_board(Board()), BLACK, args.depth, workers)
+        result['move'] = repr(result['move'])
+        print(json.dumps({'workers_count': workers, **result}))
+
+
+if __name__ == '__main__':
+    main()
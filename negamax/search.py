@@ -0,0 +1,291 @@
+import time
+from copy import deepcopy
+
+from checkers.bitboard import BitPiece, square
+from checkers.constants import BLACK, DRAW_PLIES, WHITE
+from negamax.negamax import QUIESCENCE_DEPTH, negamax
+from negamax.ordering import MoveOrdering
+from negamax.transposition_table import Flag, pack_move, unpack_move
+
+MAX_DEPTH = 64
+
+# half width of the aspiration window around the value of the previous iteration, a quarter of a man
+ASPIRATION_WINDOW = 0.25
+
+# every failed aspiration search widens the window this many times on the side that failed; once it is wider than
+# ASPIRATION_LIMIT the window is opened completely on that side
+ASPIRATION_GROWTH = 4
+ASPIRATION_LIMIT = 4
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when its time or node budget is used up or it is cancelled"""
+
+
+class SearchContext:
+    """This class holds the budget of one search, negamax checks it at every node"""
+
+    # the clock and the stop callback are checked only every this many nodes
+    CHECK_INTERVAL = 256
+
+    def __init__(self, time_limit=None, node_limit=None, ordering=None, stop=None, stats=None, evaluator=None,
+                 tablebase=None, quiescence_depth=QUIESCENCE_DEPTH, pvs=True, aspiration=ASPIRATION_WINDOW,
+                 multi_pv=1, history=(), lmr=True, futility=True, razoring=True, draw_plies=DRAW_PLIES):
+        self.deadline = None if time_limit is None else time.perf_counter() + time_limit
+        self.node_limit = node_limit
+        self.nodes = 0
+
+        # the capture sequences past the nominal depth are followed for at most this many plies (0 turns the
+        # quiescence search off); their nodes are counted in nodes and also in quiescence_nodes
+        self.quiescence_depth = quiescence_depth
+        self.quiescence_nodes = 0
+
+        self.ordering = MoveOrdering() if ordering is None else ordering
+
+        # principal variation search, and the half width of the aspiration windows (None for a full window);
+        # without both the search is plain alpha-beta
+        self.pvs = pvs
+        self.aspiration = aspiration
+
+        # the selective search of negamax: late move reductions, futility pruning and razoring; they trade the
+        # exactness of the search for depth, each can be turned off on its own
+        self.lmr = lmr
+        self.futility = futility
+        self.razoring = razoring
+
+        # how many root moves get an exact value and line; more than one turns the aspiration windows off
+        self.multi_pv = multi_pv
+
+        # ply -> best line found from the node the search is at on that ply as packed moves, filled in by negamax
+        self.pv_table = {}
+
+        # (value, move, line) of the multi_pv best root moves of the deepest completed iteration, best first
+        self.lines = []
+
+        # keys of the positions of the game that may come back, and of those and the positions on the line being
+        # searched; the search scores a position found there as a draw
+        self.game_history = frozenset(history)
+        self.history = set(self.game_history)
+
+        # plies without a capture or a man move: the history holds the positions since the last one, then the
+        # count goes on along the line being searched. At draw_plies (None for no limit) the game is drawn.
+        self.game_quiet_plies = max(len(history) - 1, 0)
+        self.quiet_plies = self.game_quiet_plies
+        self.draw_plies = draw_plies
+
+        # negamax.stats.SearchStats, None when no statistics are collected
+        self.stats = stats
+
+        # negamax.evaluation.Evaluator, None to score positions with evaluation_function
+        self.evaluator = evaluator
+
+        # negamax.tablebase.Tablebase with the solved endgames, or None
+        self.tablebase = tablebase
+
+        # callable that returns True when the search is cancelled from outside
+        self.stop = stop
+
+        # the first iteration always runs to the end, so there is a move to play
+        self.can_stop = False
+
+    def visit(self):
+        """Method to count a node and stop the search when the budget is used up"""
+        self.nodes += 1
+        if self.can_stop and self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchTimeout
+        if self.nodes % self.CHECK_INTERVAL == 0:
+            if self.stop is not None and self.stop():
+                raise SearchTimeout
+            if self.can_stop and self.deadline is not None and time.perf_counter() >= self.deadline:
+                raise SearchTimeout
+
+    def is_draw(self, key):
+        """Method to return whether the position with the key, reached on the line being searched, is a draw by
+        repetition or by the plies without progress"""
+        return key in self.history or self.draw_plies is not None and self.quiet_plies >= self.draw_plies
+
+    @property
+    def pv(self):
+        """The principal variation of the deepest completed iteration, a list of moves"""
+        return self.lines[0][2] if self.lines else []
+
+    def out_of_time(self):
+        return self.deadline is not None and time.perf_counter() >= self.deadline or \
+            self.stop is not None and self.stop()
+
+
+def iterative_deepening(board, color, transposition_table, time_limit=None, node_limit=None, max_depth=MAX_DEPTH,
+                        ordering=None, stop=None, start_depth=1, context=None, stats=None, on_iteration=None,
+                        evaluator=None, tablebase=None, quiescence_depth=QUIESCENCE_DEPTH, pvs=True,
+                        aspiration=ASPIRATION_WINDOW, multi_pv=1, history=(), lmr=True, futility=True, razoring=True):
+    """This function searches depth 1, 2, 3... until the time or node budget is used up.
+
+    Every iteration stores its best moves in the transposition table and negamax tries them first in the next
+    iteration, so the deeper searches are ordered by the shallower ones. Returns (value, move, depth) of the
+    deepest iteration that was completed, (None, None, 0) if it was cancelled before the first one; its lines are
+    left in context.pv and context.lines. The given board is not changed.
+    The other arguments set up the SearchContext, which can also be passed in whole; history takes the keys of
+    checkers.history.PositionHistory. on_iteration is called with the record of every completed iteration.
+    """
+    if context is None:
+        context = SearchContext(time_limit, node_limit, ordering, stop, stats, evaluator, tablebase,
+                                quiescence_depth, pvs, aspiration, multi_pv, history, lmr, futility, razoring)
+    stats = context.stats
+    profiler = stats.profiler() if stats is not None else None
+    # the killer and history tables of the ordering are kept between iterations; a MoveOrdering passed again to
+    # the next search keeps its history scores, halved
+    context.ordering.new_search()
+    board = deepcopy(board)
+    color_num = 1 if color == WHITE else -1
+    transposition_table.new_search()
+
+    # there is nothing to think about with a single legal move
+    if len(board.get_all_valid_moves(color)) == 1:
+        max_depth = start_depth
+
+    result = (None, None, 0)
+    for depth in range(start_depth, max_depth + 1):
+        started, nodes = time.perf_counter(), context.nodes
+        try:
+            if context.multi_pv > 1:
+                lines = search_lines(board, depth, color, color_num, transposition_table, context, context.multi_pv)
+                value, move = lines[0][:2] if lines else (float('-inf'), None)
+            else:
+                value, move = search_root(board, depth, color, color_num, transposition_table, context, result[0])
+                lines = [(value, move, _line(context.pv_table[0], move))] if move is not None else []
+        except SearchTimeout:
+            break
+        result = (value, move, depth)
+
+        # the lines stop where the search took a value from the table, the best moves stored there carry them on
+        context.lines = [(line_value, line_move, principal_variation(board, color, transposition_table, depth, line))
+                         for line_value, line_move, line in lines]
+        context.can_stop = True
+
+        if stats is not None or on_iteration is not None:
+            seconds = time.perf_counter() - started
+            if stats is not None:
+                record = stats.iteration(depth, value, move, context.nodes - nodes, seconds, context.pv)
+            else:
+                record = {'depth': depth, 'value': value, 'move': move, 'nodes': context.nodes - nodes,
+                          'seconds': seconds, 'pv': context.pv}
+            if on_iteration is not None:
+                on_iteration(record)
+
+        # stop when there is no move to play, the game is decided or the next iteration could not finish anyway
+        if move is None or abs(value) == float('inf') or context.out_of_time():
+            break
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(stats.profile_path)
+    return result
+
+
+def search_root(board, depth, color, color_num, transposition_table, context, guess=None):
+    """This function searches the position to depth in an aspiration window around guess, the value expected from
+    the previous iteration. A narrow window cuts more of the tree; if the value falls outside of it, the window is
+    widened on that side and the position is searched again. Returns (value, move) as negamax does."""
+    infinity = float('inf')
+    context.history = set(context.game_history)
+    context.quiet_plies = context.game_quiet_plies
+    delta = context.aspiration
+    if delta is None or guess is None or abs(guess) == infinity:
+        return negamax(board, depth, color, color_num, -infinity, infinity, transposition_table, context=context)
+
+    alpha, beta = guess - delta, guess + delta
+    while True:
+        value, move = negamax(board, depth, color, color_num, alpha, beta, transposition_table, context=context)
+        # a value on an open side of the window is exact, e.g. the -inf of a lost position
+        if (value > alpha or alpha == -infinity) and (value < beta or beta == infinity):
+            return value, move
+        if context.stats is not None:
+            context.stats.research('aspiration')
+        delta *= ASPIRATION_GROWTH
+        if value <= alpha:
+            alpha = -infinity if delta > ASPIRATION_LIMIT else value - delta
+        else:
+            beta = infinity if delta > ASPIRATION_LIMIT else value + delta
+
+
+def search_lines(board, depth, color, color_num, transposition_table, context, count):
+    """This function searches the position to depth and returns the count best root moves as (value, move, line),
+    best first. It is a single search: a root move is searched in a window above the value of the count-th best
+    move found so far, so the moves that cannot make the list are refuted as cheaply as in a normal search."""
+    infinity = float('inf')
+    stats, pv_table = context.stats, context.pv_table
+    context.history = set(context.game_history) | {board.key}
+    context.quiet_plies = context.game_quiet_plies
+    context.visit()
+    if stats is not None:
+        stats.node(0)
+
+    moves = board.get_all_valid_moves(color)
+    if stats is not None:
+        stats.expand(len(moves))
+    lookup = transposition_table.get_entry(board.key)
+    moves = context.ordering.order(moves, lookup.move if lookup is not None else 0, 0, color)
+
+    opponent_color = BLACK if color == WHITE else WHITE
+    lines = []
+    for piece, (move, skip) in moves:
+        bound = lines[-1][0] if len(lines) == count else -infinity
+        context.quiet_plies = context.game_quiet_plies + 1 if piece.king and not skip else 0
+        undo = board.make_move(piece, move, skip)
+        value = -1 * negamax(board, depth - 1, opponent_color, -1 * color_num, -1 * infinity, -1 * bound,
+                             transposition_table, 1, context)[0]
+        line = [pack_move((piece, move, skip)), *pv_table[1]]
+        board.unmake_move(undo)
+
+        # a value above the bound is exact; while the list is not full the bound is -inf and every value is exact
+        if value > bound or len(lines) < count:
+            lines.append((value, (piece, move, skip), line))
+            lines.sort(key=lambda entry: entry[0], reverse=True)
+            del lines[count:]
+
+    if lines:
+        transposition_table.add_entry(board.key, depth, lines[0][0], Flag.EXACT, pack_move(lines[0][1]))
+    return lines
+
+
+def _line(line, move):
+    """Returns the packed line if it starts with the move, otherwise just the move (e.g. in a lost position, where
+    no move is better than -inf)"""
+    code = pack_move(move)
+    return line if line and line[0] == code else [code]
+
+
+def principal_variation(board, color, transposition_table, length, line=()):
+    """This function returns the line of best play the search expects from the position, as a list of moves
+    (piece, destination, skipped pieces). The given line of packed moves is played first, then the best moves
+    stored in the transposition table are followed up to length plies, so call it right after the search.
+    The pieces of the moves are copies, they do not change when a board is played on. The given board is not
+    changed."""
+    board = deepcopy(board)
+    codes, moves, seen = list(line), [], set()
+    while len(moves) < max(length, len(codes)) and board.key not in seen:
+        seen.add(board.key)
+        if len(moves) < len(codes):
+            code = codes[len(moves)]
+        else:
+            entry = transposition_table.get_entry(board.key)
+            code = entry.move if entry is not None else 0
+        move = _find_move(board, color, code)
+        if move is None:
+            break
+        piece, destination, skip = move
+        moves.append((BitPiece(piece.row, piece.col, piece.color, piece.king), destination,
+                      [BitPiece(skipped.row, skipped.col, skipped.color, skipped.king) for skipped in skip]))
+        board.make_move(*move)
+        color = WHITE if color == BLACK else BLACK
+    return moves
+
+
+def _find_move(board, color, code):
+    """Returns the legal move (piece, destination, skipped pieces) of the side that the packed move stands for, or
+    None"""
+    squares = unpack_move(code)
+    for piece, (destination, skip) in board.get_all_valid_moves(color):
+        if (square(piece.row, piece.col), square(*destination)) == squares:
+            return piece, destination, skip
+    return None
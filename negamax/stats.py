@@ -0,0 +1,109 @@
+import cProfile
+from collections import Counter
+
+from negamax.transposition_table import Flag
+
+
+class SearchStats:
+    """This class collects statistics of a search: where the nodes go, how well the moves are ordered and how
+    useful the transposition table is.
+
+    The search only collects them when a SearchStats is passed to it, otherwise the counting costs nothing.
+    If profile_path is set, iterative_deepening runs under cProfile and writes the profile to that file
+    (read it with pstats or snakeviz).
+    """
+
+    def __init__(self, profile_path=None):
+        self.profile_path = profile_path
+        self.nodes = 0
+        self.expanded = 0  # nodes whose moves were generated
+        self.moves_generated = 0
+        self.max_ply = 0
+        self.quiescence_nodes = 0
+        self.max_quiescence_extension = 0  # longest capture sequence followed past the nominal depth
+        self.cutoffs = Counter()  # index of the move in the searched order -> cutoffs it caused
+        self.tt_probes = 0
+        self.tt_hits = Counter()  # flag -> hits
+        self.tt_stores = Counter()  # flag -> stores
+        self.researches = Counter()  # 'pvs', 'aspiration' or 'lmr' -> searches repeated with a wider window or deeper
+        self.reductions = Counter()  # plies -> moves searched that many plies less deep (late move reductions)
+        self.pruned = Counter()  # 'futility' -> moves skipped, 'razoring' -> nodes cut short
+        self.repetitions = 0  # positions scored as a draw because they came back or nothing happened for too long
+        self.iterations = []
+
+    def node(self, ply):
+        self.nodes += 1
+        if ply > self.max_ply:
+            self.max_ply = ply
+
+    def quiescence_node(self, ply, extension):
+        self.node(ply)
+        self.quiescence_nodes += 1
+        if extension > self.max_quiescence_extension:
+            self.max_quiescence_extension = extension
+
+    def expand(self, moves_count):
+        self.expanded += 1
+        self.moves_generated += moves_count
+
+    def cutoff(self, index):
+        self.cutoffs[index] += 1
+
+    def repetition(self):
+        self.repetitions += 1
+
+    def research(self, kind):
+        self.researches[kind] += 1
+
+    def reduction(self, plies):
+        self.reductions[plies] += 1
+
+    def prune(self, kind):
+        self.pruned[kind] += 1
+
+    def probe(self, entry):
+        self.tt_probes += 1
+        if entry is not None:
+            self.tt_hits[Flag(entry.flag).name] += 1
+
+    def store(self, flag):
+        self.tt_stores[Flag(flag).name] += 1
+
+    def iteration(self, depth, value, move, nodes, seconds, pv=()):
+        """Method to record a completed iteration of iterative deepening, returns its record"""
+        record = {'depth': depth, 'value': value, 'move': move, 'nodes': nodes, 'seconds': seconds, 'pv': pv}
+        if self.iterations and self.iterations[-1]['nodes']:
+            # how many times more nodes the iteration took than the one before
+            record['effective_branching_factor'] = nodes / self.iterations[-1]['nodes']
+        self.iterations.append(record)
+        return record
+
+    @property
+    def branching_factor(self):
+        """Average number of moves of the expanded nodes"""
+        return self.moves_generated / self.expanded if self.expanded else 0.0
+
+    def profiler(self):
+        """Method to return a started cProfile.Profile if profiling was asked for, otherwise None"""
+        if self.profile_path is None:
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def get_stats(self):
+        """Method to return all statistics as a dict"""
+        cutoffs = sum(self.cutoffs.values())
+        tt_hits = sum(self.tt_hits.values())
+        return {'nodes': self.nodes, 'expanded': self.expanded, 'max_ply': self.max_ply,
+                'quiescence_nodes': self.quiescence_nodes, 'max_quiescence_extension': self.max_quiescence_extension,
+                'branching_factor': self.branching_factor,
+                'cutoffs': cutoffs, 'cutoffs_by_move_index': dict(sorted(self.cutoffs.items())),
+                'first_move_cutoff_rate': self.cutoffs[0] / cutoffs if cutoffs else 0.0,
+                'tt_probes': self.tt_probes, 'tt_hits': dict(self.tt_hits),
+                'tt_hit_rate': tt_hits / self.tt_probes if self.tt_probes else 0.0,
+                'tt_stores': dict(self.tt_stores), 'researches': dict(self.researches),
+                'reductions': dict(sorted(self.reductions.items())), 'pruned': dict(self.pruned),
+                'repetitions': self.repetitions,
+                'iterations': [{key: value for key, value in iteration.items() if key not in ('move', 'pv')}
+                               for iteration in self.iterations]}
@@ -0,0 +1,318 @@
+import argparse
+import mmap
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from math import comb
+from os.path import exists
+
+import numpy as np
+
+from checkers.bitboard import BitBoard, SQUARES
+from checkers.constants import BLACK, DRAW_PLIES, TABLEBASE_FILENAME, WHITE
+
+# File format: a header, one index record per material signature and the tables, one byte per position.
+# A byte holds 0 for a draw (or an impossible position), otherwise 1 + the number of plies until the game is
+# over with best play: an odd number of plies is a win for the side to move, an even number a loss. The distances
+# ignore the draw after DRAW_PLIES plies without progress; Tablebase.score counts longer wins and losses as draws.
+MAGIC = b'CKTB'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHHI')  # magic, version, maximal number of pieces, number of signatures
+RECORD = struct.Struct('<BBBBQQ')  # black men, black kings, white men, white kings, offset, size
+
+# results of a probe, from the point of view of the side to move
+WIN, LOSS, DRAW = 'win', 'loss', 'draw'
+
+# men never stand on the row where they are crowned, so they are ranked over 28 squares only
+MAN_SQUARES = SQUARES - 4
+BLACK_MEN_SQUARES = range(4, SQUARES)
+WHITE_MEN_SQUARES = range(MAN_SQUARES)
+
+# the longest distance a byte can hold
+MAX_DISTANCE = 254
+
+# score of a won position for negamax, less the plies to the win; far above any evaluation
+TABLEBASE_WIN = 1000
+
+# COMBINATIONS[n][k] is comb(n, k), looked up for every position that is solved or probed
+COMBINATIONS = [[comb(n, k) for k in range(SQUARES + 1)] for n in range(SQUARES + 1)]
+
+
+def _rank(mask):
+    """Returns the index of the set of squares among all sets with as many squares (combinatorial number system)"""
+    rank, count = 0, 1
+    while mask:
+        low = mask & -mask
+        rank += COMBINATIONS[low.bit_length() - 1][count]
+        mask ^= low
+        count += 1
+    return rank
+
+
+def table_size(signature):
+    """Returns the number of positions of the table of a signature (black men, black kings, white men, white
+    kings), both sides to move"""
+    black_men, black_kings, white_men, white_kings = signature
+    return (comb(MAN_SQUARES, black_men) * comb(SQUARES, black_kings) * comb(MAN_SQUARES, white_men)
+            * comb(SQUARES, white_kings) * 2)
+
+
+def locate(black, white, kings, color):
+    """Returns the signature of the position and its index in the table of that signature"""
+    black_men, black_kings = black & ~kings, black & kings
+    white_men, white_kings = white & ~kings, white & kings
+    signature = (black_men.bit_count(), black_kings.bit_count(), white_men.bit_count(), white_kings.bit_count())
+    index = _rank(black_men >> 4)
+    index = index * COMBINATIONS[SQUARES][signature[1]] + _rank(black_kings)
+    index = index * COMBINATIONS[MAN_SQUARES][signature[2]] + _rank(white_men)
+    index = index * COMBINATIONS[SQUARES][signature[3]] + _rank(white_kings)
+    return signature, index * 2 + (color == WHITE)
+
+
+def signatures(pieces):
+    """Returns the signatures of up to the given number of pieces with at least one piece of each side, in the
+    order they have to be solved: a move leads to a position with fewer pieces (a capture), fewer men (a man
+    is crowned) or the same signature"""
+    result = []
+    for total in range(2, pieces + 1):
+        for black in range(1, total):
+            for black_men in range(black + 1):
+                for white_men in range(total - black + 1):
+                    result.append((black_men, black - black_men, white_men, total - black - white_men))
+    return sorted(result, key=lambda signature: (sum(signature), signature[0] + signature[2]))
+
+
+def successors(signature):
+    """Returns the other signatures a move can lead to, with at least one piece of each side: the side to move
+    may crown a man, the other side may lose any of its pieces"""
+    result = set()
+    for mover in (0, 2):
+        other = 2 - mover
+        men, kings = signature[other], signature[other + 1]
+        for crowned in range(min(signature[mover], 1) + 1):
+            for men_lost in range(men + 1):
+                for kings_lost in range(kings + 1):
+                    successor = list(signature)
+                    successor[mover] -= crowned
+                    successor[mover + 1] += crowned
+                    successor[other] -= men_lost
+                    successor[other + 1] -= kings_lost
+                    if successor[other] + successor[other + 1] and tuple(successor) != signature:
+                        result.add(tuple(successor))
+    return result
+
+
+def _positions(signature):
+    """Yields every position of the signature as (black, white, kings)"""
+    black_men, black_kings, white_men, white_kings = signature
+    for bm in combinations(BLACK_MEN_SQUARES, black_men):
+        taken = sum(1 << sq for sq in bm)
+        for bk in combinations(range(SQUARES), black_kings):
+            kings = sum(1 << sq for sq in bk)
+            if taken & kings:
+                continue
+            black = taken | kings
+            for wm in combinations(WHITE_MEN_SQUARES, white_men):
+                men = sum(1 << sq for sq in wm)
+                if black & men:
+                    continue
+                for wk in combinations(range(SQUARES), white_kings):
+                    white_kings_mask = sum(1 << sq for sq in wk)
+                    if (black | men) & white_kings_mask:
+                        continue
+                    yield black, men | white_kings_mask, kings | white_kings_mask
+
+
+def solve(signature, tables):
+    """Solves every position of the signature by retrograde analysis, the tables of the signatures it leads to
+    must be given. Returns the table as bytes."""
+    positions = [BitBoard(black, white, kings, color) for black, white, kings in _positions(signature)
+                 for color in (BLACK, WHITE)]
+    count = len(positions)
+    local = {(board.black, board.white, board.kings, board.turn): i for i, board in enumerate(positions)}
+
+    # moves inside the signature are edges of a graph that is solved below; the moves leaving it lead to
+    # solved positions and only their best and worst outcome is kept
+    sources, targets = [], []
+    unreachable = MAX_DISTANCE + 1
+    shortest_win = np.full(count, unreachable, dtype=np.int32)
+    longest_loss = np.zeros(count, dtype=np.int32)
+    can_draw = np.zeros(count, dtype=bool)
+    distance = np.full(count, -1, dtype=np.int32)
+    for i, board in enumerate(positions):
+        moves = board.generate_moves(board.turn)
+        if not moves:
+            distance[i] = 0
+        for move in moves:
+            undo = board.play(*move)
+            target = local.get((board.black, board.white, board.kings, board.turn))
+            successor = index = None
+            if target is None and board.black and board.white:
+                successor, index = locate(board.black, board.white, board.kings, board.turn)
+            board.unmake_move(undo)
+            if target is not None:
+                sources.append(i)
+                targets.append(target)
+                continue
+
+            # the position after the move is solved already, or the opponent has lost its last piece
+            plies = tables[successor][index] - 1 if successor is not None else 0
+            if plies < 0:
+                can_draw[i] = True
+            elif plies % 2 == 0:
+                shortest_win[i] = min(shortest_win[i], plies + 1)
+            else:
+                longest_loss[i] = max(longest_loss[i], plies + 1)
+
+    sources, targets = np.array(sources, dtype=np.int64), np.array(targets, dtype=np.int64)
+    moves_inside = np.bincount(sources, minlength=count)
+    can_escape = can_draw | (shortest_win < unreachable)
+    last = max(int(shortest_win[shortest_win < unreachable].max(initial=0)), int(longest_loss.max(initial=0)))
+
+    # the positions lost in 0 plies are known; a position is won in n plies if a move leads to a loss in n - 1,
+    # lost in n if every move leads to a win, at most in n - 1
+    plies, quiet = 1, 0
+    while plies <= last or quiet < 2:
+        if plies > MAX_DISTANCE:
+            raise ValueError(f'{signature}: distances above {MAX_DISTANCE} plies do not fit the table')
+        undecided = distance == -1
+        if plies % 2:
+            hits = np.bincount(sources[distance[targets] == plies - 1], minlength=count) > 0
+            found = undecided & ((shortest_win == plies) | hits)
+        else:
+            won = distance[targets]
+            wins = np.bincount(sources[(won >= 0) & (won % 2 == 1)], minlength=count)
+            found = undecided & ~can_escape & (longest_loss <= plies) & (wins == moves_inside)
+        distance[found] = plies
+        quiet = 0 if found.any() else quiet + 1
+        plies += 1
+
+    table = np.zeros(table_size(signature), dtype=np.uint8)
+    indexes = (locate(board.black, board.white, board.kings, board.turn)[1] for board in positions)
+    table[np.fromiter(indexes, dtype=np.int64, count=count)] = distance + 1
+    return table.tobytes()
+
+
+class Tablebase:
+    """This class holds the endgame databases: the distance to the end of the game of every position with up to
+    pieces pieces, both sides having at least one.
+
+    The databases are built with generate (or python -m negamax.tablebase) and saved with to_file; from_file
+    maps the file into memory, so loading is instant and only the probed pages are read.
+    """
+
+    def __init__(self, pieces=0, tables=None):
+        self.pieces = pieces
+        self.tables = {} if tables is None else tables
+
+    @classmethod
+    def generate(cls, pieces, workers=None, progress=None):
+        """Method to solve every signature of up to pieces pieces, on workers processes. Signatures that do not
+        depend on each other are solved at the same time, each process only gets the tables of the successors of
+        its signature; progress is called with (signature, seconds)."""
+        tables = {}
+        levels = {}
+        for signature in signatures(pieces):
+            levels.setdefault((sum(signature), signature[0] + signature[2]), []).append(signature)
+        with ProcessPoolExecutor(workers or os.cpu_count()) as pool:
+            for level in levels.values():
+                started = time.perf_counter()
+                solved = pool.map(solve, level, [{successor: tables[successor] for successor in successors(signature)}
+                                                 for signature in level])
+                for signature, table in zip(level, solved):
+                    tables[signature] = table
+                    if progress is not None:
+                        progress(signature, time.perf_counter() - started)
+        return cls(pieces, tables)
+
+    def probe(self, board, color):
+        """Method to return (WIN, LOSS or DRAW, plies to the end of the game) for the side to move, None if the
+        position is not in the tablebase"""
+        if not isinstance(board, BitBoard):
+            board = BitBoard.from_board(board)
+        if not board.black or not board.white or (board.black | board.white).bit_count() > self.pieces:
+            return None
+        signature, index = locate(board.black, board.white, board.kings, color)
+        table = self.tables.get(signature)
+        if table is None:
+            return None
+        value = table[index]
+        if not value:
+            return DRAW, 0
+        plies = value - 1
+        return (WIN if plies % 2 else LOSS), plies
+
+    def score(self, board, color):
+        """Method to return the value of the position for negamax from the side to move's point of view: wins
+        count more the sooner they come, losses less the later. None if the position is not in the tablebase."""
+        result = self.probe(board, color)
+        if result is None:
+            return None
+        outcome, plies = result
+        # the loser could reach the draw by no progress before the end, unless a capture or a man move on the way
+        # starts the count again; the table does not say, so the result is not trusted
+        if plies > DRAW_PLIES:
+            return 0
+        if outcome == WIN:
+            return TABLEBASE_WIN - plies
+        if outcome == LOSS:
+            return plies - TABLEBASE_WIN
+        return 0
+
+    def to_file(self, name=TABLEBASE_FILENAME):
+        """Method to save the tablebase to binary file"""
+        temporary = name + '.tmp'
+        with open(temporary, 'wb') as a_file:
+            a_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, self.pieces, len(self.tables)))
+            offset = HEADER.size + RECORD.size * len(self.tables)
+            for signature, table in self.tables.items():
+                a_file.write(RECORD.pack(*signature, offset, len(table)))
+                offset += len(table)
+            for table in self.tables.values():
+                a_file.write(table)
+            a_file.flush()
+            os.fsync(a_file.fileno())
+        os.replace(temporary, name)
+
+    def from_file(self, name=TABLEBASE_FILENAME):
+        """Method to map the tablebase from binary file, returns False if the file is missing or incompatible"""
+        if not exists(name):
+            return False
+        with open(name, 'rb') as a_file:
+            header = a_file.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return False
+            magic, version, pieces, count = HEADER.unpack(header)
+            if (magic, version) != (MAGIC, FORMAT_VERSION):
+                return False
+            mapped = mmap.mmap(a_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(mapped)
+        tables = {}
+        for number in range(count):
+            *signature, offset, size = RECORD.unpack_from(mapped, HEADER.size + number * RECORD.size)
+            if offset + size > len(mapped) or size != table_size(signature):
+                return False
+            tables[tuple(signature)] = view[offset:offset + size]
+        self.pieces, self.tables = pieces, tables
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Builds the endgame tablebase by retrograde analysis.')
+    parser.add_argument('--pieces', type=int, default=4, help='largest number of pieces on the board')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes')
+    parser.add_argument('--output', default=TABLEBASE_FILENAME, help='file to write the tablebase to')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    tablebase = Tablebase.generate(args.pieces, args.workers,
+                                   lambda signature, seconds: print(f'{signature} solved in {seconds:.1f} s'))
+    tablebase.to_file(args.output)
+    print(f'{len(tablebase.tables)} tables written to {args.output} in {time.perf_counter() - started:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
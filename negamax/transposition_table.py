@@ -1,73 +1,267 @@
-import pickle
-import random
-from functools import lru_cache
+import mmap
+import os
+import struct
+from enum import Enum, IntEnum
 from os.path import exists
 
-from checkers.constants import WHITE, BLACK, TRANSPOSITION_TABLE_FILENAME
+from checkers.bitboard import square
+from checkers.constants import TRANSPOSITION_TABLE_FILENAME, TRANSPOSITION_TABLE_SIZE_MB, ZOBRIST_SEED
+
+# File format: a fixed-size header followed by the buffer of the table exactly as it is laid out in memory.
+# The header records everything that makes the keys and the layout meaningful, so files written with another
+# Zobrist seed or board encoding are never mixed with the current ones.
+MAGIC = b'CKTT'
+FORMAT_VERSION = 2
+BOARD_ENCODING = 1  # 32 dark squares, Zobrist numbers of checkers.zobrist
+HEADER = struct.Struct('<4sHHQQHB')  # magic, version, board encoding, Zobrist seed, slots, entry size, generation
+HEADER_SIZE = 64
+
+
+# Flags for the transposition table records, 0 marks an empty slot
+class Flag(IntEnum):
+    EXACT = 1
+    LOWERBOUND = 2
+    UPPERBOUND = 3
+
+
+# Which slot a new result may take
+class Replacement(Enum):
+    DEPTH = 'depth'  # keep the deeper result, unless the stored one is from an earlier search
+    ALWAYS = 'always'  # the newest result always wins
+    TWO_TIER = 'two_tier'  # buckets of two slots: a depth-preferred one and an always-replace one
+
+
+def pack_move(move):
+    """Packs the move (piece, destination, skipped pieces) into 16 bits: start square, end square, valid bit"""
+    if move is None:
+        return 0
+    piece, (row, col), _ = move
+    return 1 << 10 | square(row, col) << 5 | square(piece.row, piece.col)
+
+
+def unpack_move(code):
+    """Returns (start square, end square) of a packed move, or None"""
+    if not code:
+        return None
+    return code & 31, code >> 5 & 31
 
 
 class TranspositionTable:
-    """This class represents the transposition table that stores the board configurations and their attributes"""
-
-    def __init__(self):
-        self.d = {}
-
-        # I used Zobrist Hashing to hash board configurations. It is a common way to hash board games states.
-        # I took the implementation of Zobrist Hashing from https://iq.opengenus.org/zobrist-hashing-game-theory/
-        self.zobTable = [[[random.randint(1, 2**64 - 1) for _ in range(12)] for _ in range(8)] for _ in range(8)]
-
-    @staticmethod
-    def index(piece):
-        """Method to calculate the index of the piece based on its color"""
-        if piece == WHITE:
-            return 0
-        if piece == BLACK:
-            return 1
-        else:
-            return -1
-
-    # Added cash to store the hashes of boards to not recalculate them
-    @lru_cache(maxsize=1024)
-    def compute_hash(self, board):
-        """Method to calculate hash of the board configuration using Zobrist Hashing"""
-        h = 0
-        for i in range(8):
-            for j in range(8):
-                place = board[i][j]
-                if board[i][j] != 0:
-                    piece = self.index(place)
-                    h ^= self.zobTable[i][j][piece]
-        return h
-
-    def add_entry(self, board, depth, value, flag):
-        """Method to add entry to the transposition table"""
-        entry_hash = self.compute_hash(tuple(tuple(sublist) for sublist in board))
-        if self.d.get(entry_hash) is None:
-            self.d[entry_hash] = TableEntry(depth, value, flag)
-
-    def get_entry(self, board):
+    """This class represents the transposition table that stores the board configurations and their attributes.
+
+    The table has a fixed number of slots chosen from its size in megabytes. The fields of all entries are kept
+    in packed arrays inside one buffer, a slot is chosen by the low bits of the Zobrist key.
+    """
+
+    # key, value, best move, depth, flag and generation of one entry, in bytes
+    FIELDS = (('keys', 'Q', 8), ('values', 'f', 4), ('moves', 'H', 2),
+              ('depths', 'B', 1), ('flags', 'B', 1), ('generations', 'B', 1))
+    ENTRY_SIZE = sum(size for _, _, size in FIELDS)
+
+    def __init__(self, size_mb=TRANSPOSITION_TABLE_SIZE_MB, replacement=Replacement.DEPTH, buffer=None):
+        """The table is allocated from size_mb, or laid out in the given buffer (e.g. shared memory)"""
+        self.replacement = replacement
+
+        # the number of slots is a power of two, so the slot index is just a mask of the key
+        self.size = self._slots_for(size_mb * 2**20 if buffer is None else len(buffer))
+        self.mask = self.size - 1
+        self.generation = 0
+        self._attach(bytearray(self.size * self.ENTRY_SIZE) if buffer is None else buffer)
+
+        self.hits = self.misses = self.stores = self.overwrites = 0
+
+    @classmethod
+    def buffer_size(cls, size_mb):
+        """Method to return how many bytes the buffer of a table of size_mb megabytes takes"""
+        return cls._slots_for(size_mb * 2**20) * cls.ENTRY_SIZE
+
+    @classmethod
+    def _slots_for(cls, capacity):
+        """Method to return the largest power of two number of slots that fits in capacity bytes"""
+        size = 2
+        while size * 2 * cls.ENTRY_SIZE <= capacity:
+            size *= 2
+        return size
+
+    def _attach(self, buffer):
+        """Method to lay the packed arrays of the fields out in the buffer"""
+        self.buffer = buffer
+        view = memoryview(buffer)
+        offset = 0
+        for name, code, size in self.FIELDS:
+            setattr(self, name, view[offset:offset + self.size * size].cast(code))
+            offset += self.size * size
+
+    def release(self):
+        """Method to release the views of the buffer, e.g. before its shared memory is closed"""
+        for name, _, _ in self.FIELDS:
+            getattr(self, name).release()
+        if isinstance(self.buffer, memoryview):
+            self.buffer.release()
+
+    def new_search(self):
+        """Method to start a new generation, so entries of the earlier searches are replaced first"""
+        self.generation = (self.generation + 1) % 256
+
+    def clear(self):
+        """Method to empty the table"""
+        self.flags[:] = bytes(self.size)
+
+    def _slots(self, key):
+        """Method to return the slots where the key may be stored"""
+        index = key & self.mask
+        if self.replacement == Replacement.TWO_TIER:
+            index &= ~1
+            return index, index + 1
+        return index,
+
+    # The stored key is xor'ed with a check of the other fields. Several processes may write the same slot of a
+    # shared table at once (and a crash may leave half an entry behind); the fields of such an entry do not
+    # belong together, its key does not match any position and it is treated as an empty slot.
+    def _check(self, index):
+        return (hash(self.values[index]) ^ self.moves[index] << 16 ^ self.depths[index] << 32
+                ^ self.flags[index] << 40) & 0xFFFFFFFFFFFFFFFF
+
+    def _key_at(self, index):
+        """Method to return the key stored in the slot, or None for an empty slot"""
+        if not self.flags[index]:
+            return None
+        return self.keys[index] ^ self._check(index)
+
+    def add_entry(self, key, depth, value, flag, move=0):
+        """Method to add entry to the transposition table. The key is the Zobrist key kept by the board."""
+        self.stores += 1
+        index = self._slots(key)[0]
+        stored = self._key_at(index)
+        depths, generations = self.depths, self.generations
+
+        if self.replacement == Replacement.DEPTH:
+            # a deeper result of the current search is not given up for a shallower one
+            if stored is not None and stored != key and generations[index] == self.generation \
+                    and depths[index] > depth:
+                return
+        elif self.replacement == Replacement.TWO_TIER:
+            if stored != key and self._key_at(index + 1) == key:
+                index += 1
+            elif stored is None or stored == key or generations[index] != self.generation \
+                    or depth >= depths[index]:
+                # the result takes the depth-preferred slot, its old entry moves down to the other slot
+                if stored is not None and stored != key:
+                    self._copy(index, index + 1)
+            else:
+                index += 1
+            stored = self._key_at(index)
+
+        if stored is not None and stored != key:
+            self.overwrites += 1
+        elif stored is not None and not move:
+            # keep the best move that is already known for the position
+            move = self.moves[index]
+
+        self.values[index] = value
+        self.moves[index] = move
+        depths[index] = depth
+        self.flags[index] = flag
+        generations[index] = self.generation
+        self.keys[index] = key ^ self._check(index)
+
+    def _copy(self, source, target):
+        for name, _, _ in self.FIELDS:
+            array = getattr(self, name)
+            array[target] = array[source]
+
+    def get_entry(self, key):
         """Method to retrieve entry from the transposition table"""
-        entry_hash = self.compute_hash(tuple(tuple(sublist) for sublist in board))
-        return self.d.get(entry_hash)
+        for index in self._slots(key):
+            if self.flags[index] and self._key_at(index) == key:
+                self.hits += 1
+                return TableEntry(self.depths[index], self.values[index], self.flags[index], self.moves[index])
+        self.misses += 1
+        return None
+
+    def get_stats(self):
+        """Method to return the hit, miss and overwrite counters"""
+        probes = self.hits + self.misses
+        return {'size': self.size, 'hits': self.hits, 'misses': self.misses, 'stores': self.stores,
+                'overwrites': self.overwrites, 'hit_rate': self.hits / probes if probes else 0.0}
+
+    def merge(self, other):
+        """Method to add all entries of another table, e.g. one saved on another machine"""
+        for index in range(other.size):
+            key = other._key_at(index)
+            if key is not None:
+                self.add_entry(key, other.depths[index], other.values[index], other.flags[index],
+                               other.moves[index])
 
     def to_file(self, name=TRANSPOSITION_TABLE_FILENAME):
-        """Method to save the transposition table to binary file"""
-        a_file = open(name, "wb")
-        pickle.dump(self.d, a_file)
-        a_file.close()
+        """Method to save the transposition table to binary file.
+
+        The table is written to a temporary file that then replaces the old one, so a crash while saving
+        leaves the previous file intact.
+        """
+        data = bytes(self.buffer)
+        if isinstance(self.buffer, memoryview):
+            # the table is mapped from a file, keep working on a copy so that file can be replaced
+            mapped = self.buffer.obj
+            self._attach(bytearray(data))
+            mapped.close()
+
+        temporary = name + '.tmp'
+        with open(temporary, 'wb') as a_file:
+            header = HEADER.pack(MAGIC, FORMAT_VERSION, BOARD_ENCODING, ZOBRIST_SEED, self.size, self.ENTRY_SIZE,
+                                 self.generation)
+            a_file.write(header.ljust(HEADER_SIZE, b'\0'))
+            a_file.write(data)
+            a_file.flush()
+            os.fsync(a_file.fileno())
+        os.replace(temporary, name)
 
     def from_file(self, name=TRANSPOSITION_TABLE_FILENAME):
-        """Method to retrieve the transposition table from binary file"""
-        file_exists = exists(name)
-        if file_exists:
-            a_file = open(name, "rb")
-            self.d = pickle.load(a_file)
+        """Method to retrieve the transposition table from binary file.
+
+        The file is memory-mapped copy-on-write: loading takes constant time, pages are read when the search
+        touches them and changes stay in memory until to_file. Returns False if the file is missing or was
+        written in an incompatible format.
+        """
+        if not exists(name):
+            return False
+        with open(name, 'rb') as a_file:
+            header = a_file.read(HEADER_SIZE)
+            if len(header) < HEADER_SIZE:
+                return False
+            magic, version, encoding, seed, size, entry_size, generation = HEADER.unpack_from(header)
+            if (magic, version, encoding, seed, entry_size) != \
+                    (MAGIC, FORMAT_VERSION, BOARD_ENCODING, ZOBRIST_SEED, self.ENTRY_SIZE):
+                return False
+            if os.fstat(a_file.fileno()).st_size != HEADER_SIZE + size * entry_size:
+                return False
+            mapped = mmap.mmap(a_file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        # the size of the saved table wins over the configured one
+        self.size, self.mask, self.generation = size, size - 1, generation
+        self._attach(memoryview(mapped)[HEADER_SIZE:])
+        return True
+
+
+def merge_files(target, *sources):
+    """Merges the tables saved in the source files into the target file"""
+    table = TranspositionTable()
+    table.from_file(target)
+    for source in sources:
+        other = TranspositionTable(size_mb=0)
+        if not other.from_file(source):
+            raise ValueError(f'{source} is not a compatible transposition table file')
+        table.merge(other)
+    table.to_file(target)
 
 
 class TableEntry:
     """Class for transposition table entry"""
 
-    def __init__(self, depth, value, flag):
+    __slots__ = ('depth', 'value', 'flag', 'move')
+
+    def __init__(self, depth, value, flag, move=0):
         self.depth = depth
         self.value = value
         self.flag = flag
+        self.move = move
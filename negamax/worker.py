@@ -0,0 +1,112 @@
+import multiprocessing
+import queue
+
+from checkers.constants import TABLEBASE_FILENAME, TRANSPOSITION_TABLE_FILENAME
+from negamax.evaluation import Evaluator
+from negamax.ordering import MoveOrdering
+from negamax.search import iterative_deepening
+from negamax.tablebase import Tablebase
+from negamax.transposition_table import TranspositionTable
+
+# pondering searches until it is cancelled, this only keeps it from running forever in a decided position
+PONDER_DEPTH = 32
+
+
+def _serve(requests, results, cancelled, filename):
+    """Loop of the worker process: runs the requested searches one after another"""
+    transposition_table = TranspositionTable()
+    transposition_table.from_file(filename)
+    ordering = MoveOrdering()
+    evaluator = Evaluator()
+
+    # the endgame tablebase is optional, it is built with python -m negamax.tablebase
+    tablebase = Tablebase()
+    if not tablebase.from_file(TABLEBASE_FILENAME):
+        tablebase = None
+
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        kind, job, board, color, limits = request
+        if kind == 'save':
+            transposition_table.to_file(filename)
+            continue
+        if cancelled.value >= job:
+            continue
+
+        result = iterative_deepening(board, color, transposition_table, ordering=ordering,
+                                     stop=lambda: cancelled.value >= job, evaluator=evaluator,
+                                     tablebase=tablebase, **limits)
+        if kind == 'search':
+            results.put((job, result))
+
+
+class SearchWorker:
+    """This class runs the search in a separate process, so the caller (e.g. the pygame loop) is never blocked.
+
+    The process owns the transposition table and the move ordering tables, so they stay warm between moves.
+    Every request gets a job number; cancelling marks all jobs up to the current one as cancelled, and the
+    search checks that mark while it runs. Pondering searches a position on the opponent's time only to fill the
+    transposition table, its result is thrown away.
+    """
+
+    def __init__(self, transposition_table_file=TRANSPOSITION_TABLE_FILENAME):
+        self._requests = multiprocessing.Queue()
+        self._results = multiprocessing.Queue()
+        self._cancelled = multiprocessing.Value('q', 0)
+        self._job = 0
+        self._pending = None
+        self._process = multiprocessing.Process(target=_serve, daemon=True,
+                                                args=(self._requests, self._results, self._cancelled,
+                                                      transposition_table_file))
+        self._process.start()
+
+    @property
+    def thinking(self):
+        """True while the result of a search is awaited"""
+        return self._pending is not None
+
+    def _submit(self, kind, board=None, color=None, **limits):
+        self.cancel()
+        self._job += 1
+        self._requests.put((kind, self._job, board, color, limits))
+        return self._job
+
+    def search(self, board, color, time_limit=None, node_limit=None, history=()):
+        """Method to start searching the best move of the side, the result is returned by poll. history holds the
+        keys of the positions of the game that may come back (see checkers.history)."""
+        self._pending = self._submit('search', board, color, time_limit=time_limit, node_limit=node_limit,
+                                     history=list(history))
+
+    def ponder(self, board, color, history=()):
+        """Method to search the position on the opponent's time, until the next request or cancel"""
+        self._submit('ponder', board, color, max_depth=PONDER_DEPTH, history=list(history))
+
+    def cancel(self):
+        """Method to stop the running search and drop the requests that have not started yet"""
+        with self._cancelled.get_lock():
+            self._cancelled.value = self._job
+        self._pending = None
+
+    def poll(self):
+        """Method to return (value, move, depth) of the awaited search once it is done, otherwise None"""
+        while self._pending is not None:
+            try:
+                job, result = self._results.get_nowait()
+            except queue.Empty:
+                return None
+            if job == self._pending:
+                self._pending = None
+                return result
+        return None
+
+    def close(self, save=True, timeout=5):
+        """Method to stop the worker process, saving its transposition table first if asked"""
+        self.cancel()
+        if save:
+            self._requests.put(('save', 0, None, None, {}))
+        self._requests.put(None)
+        self._process.join(timeout)
+        if self._process.is_alive():
+            self._process.terminate()
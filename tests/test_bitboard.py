@@ -0,0 +1,30 @@
+from checkers.bitboard import BitBoard, SQUARE_TO_ROW_COL, iter_bits
+from checkers.constants import BLACK
+
+# the black king on 10 can capture all four white men and land on its own square again
+CAPTURE_LOOP = 'B:W15,23,22,14:BK10'
+
+
+def test_capture_loop_is_generated_once():
+    board = BitBoard.from_fen(CAPTURE_LOOP)
+    assert board.generate_moves(BLACK) == [(9, 9, board.white)]
+
+
+def test_capture_loop_keeps_the_king():
+    board = BitBoard.from_fen(CAPTURE_LOOP)
+    (start, end, captured), = board.generate_moves(BLACK)
+    board.move(board._piece_at(start), *SQUARE_TO_ROW_COL[end])
+    board.remove([board._piece_at(sq) for sq in iter_bits(captured)])
+    assert board.to_fen() == 'W:W:BK10'
+    assert board.winner == BLACK
+    assert board.key == BitBoard.from_fen('W:W:BK10').key
+
+
+def test_capture_loop_can_be_played_and_taken_back():
+    board = BitBoard.from_fen(CAPTURE_LOOP)
+    (start, end, captured), = board.generate_moves(BLACK)
+    undo = board.play(start, end, captured)
+    assert board.to_fen() == 'W:W:BK10'
+    assert board.key == BitBoard.from_fen('W:W:BK10').key
+    board.unmake_move(undo)
+    assert board.to_fen() == BitBoard.from_fen(CAPTURE_LOOP).to_fen()
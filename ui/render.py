@@ -0,0 +1,123 @@
+from functools import lru_cache
+
+import pygame
+
+from checkers.bitboard import BitPiece
+from checkers.constants import ROWS, COLS, SQUARE_SIZE, WHITE_RGB, GREY, BLUE, SIDE_RGB
+
+# Everything that draws with pygame lives here, so the rules and the engine can be used without it.
+CROWN = pygame.transform.scale(pygame.image.load('assets/img.png'), (44, 25))
+
+PADDING = 15
+OUTLINE = 2
+
+
+def square_center(row, col):
+    """Returns the pixel position of the center of the square"""
+    return SQUARE_SIZE * col + SQUARE_SIZE // 2, SQUARE_SIZE * row + SQUARE_SIZE // 2
+
+
+def draw_squares(win):
+    win.fill(GREY)
+    for row in range(ROWS):
+        for col in range(row % 2, COLS, 2):
+            pygame.draw.rect(win, WHITE_RGB, (row * SQUARE_SIZE, col * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
+
+
+def draw_piece(win, piece):
+    x, y = square_center(piece.row, piece.col)
+    radius = SQUARE_SIZE // 2 - PADDING
+    pygame.draw.circle(win, GREY, (x, y), radius + OUTLINE)
+    pygame.draw.circle(win, SIDE_RGB[piece.color], (x, y), radius)
+    if piece.king:
+        win.blit(CROWN, (x - CROWN.get_width() // 2, y - CROWN.get_height() // 2))
+
+
+def draw_valid_moves(win, moves):
+    for move in moves:
+        row, col = move
+        pygame.draw.circle(win, BLUE, square_center(row, col), 15)
+
+
+@lru_cache(maxsize=None)
+def thinking_text():
+    return pygame.font.Font(None, 36).render('Thinking...', True, BLUE, WHITE_RGB)
+
+
+def draw_thinking(win):
+    """Shows that the AI is searching its move"""
+    text = thinking_text()
+    win.blit(text, (win.get_width() - text.get_width() - 10, 10))
+
+
+class BoardRenderer:
+    """This class draws the game window frame after frame, but only the squares that changed since the last frame.
+
+    The empty board is drawn once to a surface; a changed square is copied from it and its piece and move marker
+    are drawn on top. Only the rectangles of the changed squares are passed to pygame.display.update, and a frame
+    where nothing changed is not drawn at all. Whatever else draws to the window (e.g. a menu) has to call
+    invalidate, so the next frame draws everything again.
+    """
+
+    def __init__(self, win):
+        self.win = win
+        self.background = pygame.Surface(win.get_size())
+        draw_squares(self.background)
+
+        # (row, col) -> (piece colour or None, king, marked as a valid move) as it is drawn in the window; the light
+        # squares are always empty
+        self.drawn = {}
+        self.thinking = False
+        self.full = True
+
+    def invalidate(self):
+        """Method to draw the whole window with the next frame"""
+        self.full = True
+
+    def draw(self, board, valid_moves=(), thinking=False):
+        """Method to draw the board (Board or BitBoard), the valid moves of the selected piece and whether the AI
+        is thinking. Returns the rectangles that were updated, empty for an idle frame."""
+        dirty = set()
+        for row in range(ROWS):
+            for col in range((row + 1) % 2, COLS, 2):
+                piece = board.get_piece(row, col)
+                state = (None, False) if piece == 0 else (piece.color, piece.king)
+                state += ((row, col) in valid_moves,)
+                if self.full or self.drawn.get((row, col)) != state:
+                    self.drawn[row, col] = state
+                    dirty.add((row, col))
+
+        # the text overlaps some squares: they are drawn again when it comes or goes, and it is drawn again on
+        # top of them when one of them changed
+        text = thinking_text().get_rect(topright=(self.win.get_width() - 10, 10))
+        covered = {(row, col) for row in range(ROWS) for col in range(COLS)
+                   if text.colliderect(self._square(row, col))}
+        if thinking != self.thinking:
+            dirty |= covered
+            self.thinking = thinking
+
+        if self.full:
+            self.win.blit(self.background, (0, 0))
+            rects = [self.win.get_rect()]
+        else:
+            rects = [self._square(row, col) for row, col in dirty]
+            for rect in rects:
+                self.win.blit(self.background, rect, rect)
+        for row, col in dirty:
+            color, king, marked = self.drawn.get((row, col), (None, False, False))
+            if color is not None:
+                draw_piece(self.win, BitPiece(row, col, color, king))
+            if marked:
+                draw_valid_moves(self.win, ((row, col),))
+        if thinking and (self.full or dirty & covered):
+            draw_thinking(self.win)
+            rects.append(text)
+
+        self.full = False
+        if rects:
+            pygame.display.update(rects)
+        return rects
+
+    @staticmethod
+    def _square(row, col):
+        return pygame.Rect(col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)